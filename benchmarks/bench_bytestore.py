@@ -0,0 +1,56 @@
+# LocalFileStore와 SQLiteByteStore의 임베딩 저장/조회 성능 비교
+# 실행: python -m benchmarks.bench_bytestore
+import json, os, random, tempfile, time
+from langchain.storage import LocalFileStore
+from utils.bytestore import SQLiteByteStore
+
+COUNT = 100_000
+DIMENSION = 1536
+BATCH_SIZE = 1000
+
+
+def folder_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path), 1
+    total, files = 0, 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            total += os.path.getsize(os.path.join(root, name))
+            files += 1
+    return total, files
+
+
+# 10만개의 임베딩을 한번에 만들면 메모리가 부족하므로 배치 단위로 생성
+def make_batch(start):
+    rng = random.Random(start)
+    return [
+        (f"key-{i}", json.dumps([rng.uniform(-0.1, 0.1) for _ in range(DIMENSION)]).encode())
+        for i in range(start, min(start + BATCH_SIZE, COUNT))
+    ]
+
+
+def run(name, store, path):
+    write = 0.0
+    for i in range(0, COUNT, BATCH_SIZE):
+        batch = make_batch(i)
+        start = time.perf_counter()
+        store.mset(batch)
+        write += time.perf_counter() - start
+
+    keys = [f"key-{i}" for i in range(COUNT)]
+    random.shuffle(keys)
+    start = time.perf_counter()
+    for i in range(0, COUNT, BATCH_SIZE):
+        store.mget(keys[i : i + BATCH_SIZE])
+    read = time.perf_counter() - start
+
+    size, files = folder_size(path)
+    print(f"{name:20} write {write:7.2f}s  read {read:7.2f}s  {size / 2**20:8.1f}MB  {files} files")
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        run("LocalFileStore", LocalFileStore(f"{tmp}/local"), f"{tmp}/local")
+        for quantize in [None, "float16", "int8"]:
+            path = f"{tmp}/{quantize or 'float32'}.sqlite"
+            run(f"SQLite ({quantize or 'float32'})", SQLiteByteStore(path, quantize), path)
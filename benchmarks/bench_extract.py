@@ -0,0 +1,63 @@
+# 저장된 HTML 페이지에서 본문을 추출하는 속도(pages/sec)를 비교
+# 기존 방식: html.parser로 전체 트리를 만든 뒤 <main>의 텍스트를 문자열 치환
+# Extractor: <main> 하위만 lxml로 파싱하고 선택자로 footer 등을 제거
+# 실행: python -m benchmarks.bench_extract [HTML 파일이 있는 폴더]
+# 폴더를 지정하지 않으면 Cloudflare 문서와 비슷한 구조의 페이지를 만들어서 사용
+import glob, sys, time
+from bs4 import BeautifulSoup
+from utils.extract import Extractor
+
+ROUNDS = 3
+
+
+def make_pages(count=200):
+    nav = "".join(f'<li><a href="/workers-ai/{i}/">메뉴 {i}</a></li>' for i in range(300))
+    pages = []
+    for i in range(count):
+        body = "".join(
+            f"<h2>Section {j}</h2><p>Workers AI는 Cloudflare 네트워크에서 모델을 실행합니다. 예제 {i}-{j}</p>"
+            f"<pre><code>npx wrangler ai models --json</code></pre>"
+            for j in range(40)
+        )
+        pages.append(
+            f"<html><head><script>var x = {i};</script><style>p {{ color: red }}</style></head>"
+            f"<body><header>Cloudflare Docs</header><nav><ul>{nav}</ul></nav>"
+            f"<main><article>{body}</article>"
+            f"<footer>Edit page Cloudflare Dashboard Discord Community Learning Center Support Portal Cookie Settings</footer>"
+            f"</main></body></html>"
+        )
+    return pages
+
+
+def load_pages(folder):
+    pages = []
+    for path in glob.glob(f"{folder}/*.html"):
+        with open(path, encoding="utf-8") as f:
+            pages.append(f.read())
+    return pages
+
+
+def parse_page_before(html):
+    soup = BeautifulSoup(html, "html.parser")
+    return (
+        str(soup.find("main").get_text())
+        .replace("\n", " ")
+        .replace("\xa0", " ")
+        .replace("Edit page   Cloudflare DashboardDiscordCommunityLearning CenterSupport Portal  Cookie Settings", "")
+    )
+
+
+def measure(name, extract, pages):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for html in pages:
+            extract(html)
+    elapsed = time.perf_counter() - start
+    print(f"{name:10} {len(pages) * ROUNDS / elapsed:8.1f} pages/sec")
+
+
+if __name__ == "__main__":
+    pages = load_pages(sys.argv[1]) if len(sys.argv) > 1 else make_pages()
+    print(f"{len(pages)} pages")
+    measure("before", parse_page_before, pages)
+    measure("Extractor", Extractor(target="main", remove_selectors=["footer", "nav", "script", "style"]), pages)
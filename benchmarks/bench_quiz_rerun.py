@@ -0,0 +1,89 @@
+# QuizGPT에서 답을 고르고 "제출"을 누를 때의 서버 처리 시간을 비교
+# before: 페이지 전체 스크립트를 다시 실행 (fragment 도입 전의 동작)
+# fragment: quiz_form fragment만 다시 실행
+# 실행: python -m benchmarks.bench_quiz_rerun
+# streamlit AppTest로 실제 페이지를 실행하고, API key 검증과 위키피디아 검색은 stub으로 대체
+# 퀴즈는 미리 저장소에 넣어두므로 LLM은 호출하지 않음
+# AppTest는 fragment 안의 위젯을 눌러도 전체를 다시 실행하므로, fragment만 다시 실행되는 시간은
+# 페이지에서 import/상수/함수 정의만 뽑은 스크립트로 quiz_form을 실행해서 측정
+import ast, json, os, statistics, sys, tempfile, time
+from streamlit.testing.v1 import AppTest
+from langchain.schema import Document
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGE_PATH = os.path.join(ROOT, "pages", "03_QuizGPT.py")
+ROUNDS = 20
+TOPIC = "Rome"
+TOTAL_COUNT = 3
+DIFFICULTY = "쉬움"
+QUESTIONS = [
+    {
+        "question": f"{TOPIC} 문제 {i}",
+        "answers": [{"answer": f"보기 {j}", "correct": j == 0} for j in range(4)],
+    }
+    for i in range(TOTAL_COUNT)
+]
+
+
+# 페이지 스크립트에서 화면을 그리는 코드는 빼고 import, 대문자 상수, 함수/클래스 정의만 남김
+def page_definitions(path):
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    keep = [
+        node
+        for node in tree.body
+        if isinstance(node, (ast.Import, ast.ImportFrom, ast.FunctionDef, ast.ClassDef))
+        or (isinstance(node, ast.Assign) and all(isinstance(target, ast.Name) and target.id.isupper() for target in node.targets))
+    ]
+    return ast.unparse(ast.Module(body=keep, type_ignores=[]))
+
+
+def install_stubs():
+    import utils.auth, utils.wiki
+    from utils.cache import DiskCache
+
+    utils.auth.is_valid = lambda key: True
+    utils.wiki.search_wikipedia = lambda term, top_k=5: [
+        Document(page_content=f"{term} 문서 {i}", metadata={"title": term, "source": ""}) for i in range(top_k)
+    ]
+    store = DiskCache("./.cache/quizzes.sqlite")
+    store.set(json.dumps([TOPIC, TOTAL_COUNT, DIFFICULTY], ensure_ascii=False), {"questions": QUESTIONS})
+
+
+# 답을 하나 고르고 제출 버튼을 누른 뒤 다시 실행이 끝날 때까지의 시간
+def measure(name, app):
+    times = []
+    for i in range(ROUNDS):
+        app.radio[0].set_value(f"보기 {i % 4}")
+        start = time.perf_counter()
+        app.button[0].click().run()
+        times.append(time.perf_counter() - start)
+    assert not app.exception, app.exception
+    print(f"{name:10} median {statistics.median(times) * 1000:7.1f} ms  max {max(times) * 1000:7.1f} ms")
+
+
+def full_page():
+    app = AppTest.from_file(PAGE_PATH, default_timeout=30)
+    app.run()
+    app.sidebar.text_input[0].input("sk-bench").run()
+    app.sidebar.selectbox[1].select("Wikipedia").run()
+    app.sidebar.text_input[1].input(TOPIC).run()
+    return app
+
+
+def fragment_only():
+    script = page_definitions(PAGE_PATH) + f"\n\nquiz_form({TOPIC!r}, [], {TOTAL_COUNT}, {DIFFICULTY!r})\n"
+    app = AppTest.from_string(script, default_timeout=30)
+    app.session_state["quiz"] = {"key": (TOPIC, TOTAL_COUNT, DIFFICULTY), "questions": QUESTIONS}
+    app.run()
+    return app
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, ROOT)
+    # .cache 폴더가 저장소를 더럽히지 않도록 임시 폴더에서 실행
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        install_stubs()
+        measure("before", full_page())
+        measure("fragment", fragment_only())
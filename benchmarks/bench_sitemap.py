@@ -0,0 +1,56 @@
+# 20만개 URL의 사이트맵에서 필터에 맞는 URL을 찾을 때,
+# BeautifulSoup으로 전체를 파싱한 뒤 거르는 방식과 parse_sitemap의 스트리밍 방식을 비교
+# 실행: python -m benchmarks.bench_sitemap
+import io, time, tracemalloc
+from bs4 import BeautifulSoup
+from utils.sitemap import parse_sitemap
+
+COUNT = 200_000
+SECTIONS = ["ai-gateway", "vectorize", "workers-ai", "workers", "pages", "r2", "d1", "dns", "ssl", "waf"]
+FILTER_URLS = [
+    "https://developers.cloudflare.com/ai-gateway/",
+    "https://developers.cloudflare.com/vectorize/",
+    "https://developers.cloudflare.com/workers-ai/",
+]
+
+
+def make_sitemap():
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">']
+    for i in range(COUNT):
+        section = SECTIONS[i % len(SECTIONS)]
+        lines.append(
+            f"<url><loc>https://developers.cloudflare.com/{section}/page-{i}/</loc>"
+            f"<lastmod>2024-09-{i % 28 + 1:02d}T00:00:00.000Z</lastmod></url>"
+        )
+    lines.append("</urlset>")
+    return "\n".join(lines).encode()
+
+
+def parse_soup(data):
+    soup = BeautifulSoup(data, "xml")
+    return [
+        {"loc": url.find("loc").text, "lastmod": url.find("lastmod").text}
+        for url in soup.find_all("url")
+        if any(url.find("loc").text.startswith(prefix) for prefix in FILTER_URLS)
+    ]
+
+
+def parse_stream(data):
+    return list(parse_sitemap(io.BytesIO(data), FILTER_URLS))
+
+
+def measure(name, parse, data):
+    tracemalloc.start()
+    start = time.perf_counter()
+    entries = parse(data)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:14} {elapsed:6.2f}s  peak {peak / 2**20:7.1f}MB  {len(entries)} urls")
+
+
+if __name__ == "__main__":
+    data = make_sitemap()
+    print(f"sitemap {len(data) / 2**20:.1f}MB, {COUNT} urls")
+    measure("BeautifulSoup", parse_soup, data)
+    measure("iterparse", parse_stream, data)
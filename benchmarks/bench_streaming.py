@@ -0,0 +1,74 @@
+# 2,000 토큰 답변의 스트리밍을 재현해서, 토큰마다 그릴 때와 StreamRenderer로 모아서 그릴 때의
+# markdown 렌더링 횟수와 CPU 시간을 비교
+# 실행: python -m benchmarks.bench_streaming
+import random, time
+import markdown
+from utils.streaming import StreamRenderer
+
+TOKENS = 2000
+# 초당 토큰 수 (gpt-4o-mini 스트리밍 속도 기준)
+TOKENS_PER_SECOND = 80
+WORDS = ["Workers", "AI", "는", "Cloudflare", "네트워크", "에서", "모델을", "실행", "합니다", "**중요**", "`wrangler`", "-", "1."]
+
+
+# 실제 답변처럼 문단과 목록이 섞인 토큰 스트림을 만듦
+def make_stream():
+    rng = random.Random(0)
+    tokens = []
+    for i in range(TOKENS):
+        token = " " + rng.choice(WORDS)
+        if i % 40 == 39:
+            token += "\n\n"
+        tokens.append(token)
+    return tokens
+
+
+# st.empty() 대신 markdown 변환 비용만 측정하는 가짜 container
+class Box:
+    def __init__(self):
+        self.frames = 0
+
+    def markdown(self, text):
+        self.frames += 1
+        markdown.markdown(text)
+
+
+# 실제로 기다리지 않고 토큰 간격만큼 시간이 흐른 것처럼 보이게 하는 시계
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def replay_naive(tokens):
+    box = Box()
+    message = ""
+    start = time.process_time()
+    for token in tokens:
+        message += token
+        box.markdown(message)
+    return box.frames, time.process_time() - start
+
+
+def replay_renderer(tokens, fps):
+    box = Box()
+    clock = Clock()
+    renderer = StreamRenderer(fps=fps, clock=clock)
+    renderer.start(box)
+    start = time.process_time()
+    for token in tokens:
+        clock.now += 1 / TOKENS_PER_SECOND
+        renderer.write(token)
+    renderer.flush()
+    return box.frames, time.process_time() - start
+
+
+if __name__ == "__main__":
+    tokens = make_stream()
+    frames, cpu = replay_naive(tokens)
+    print(f"{'per token':16} frames {frames:5}  cpu {cpu:6.2f}s")
+    for fps in [20, 10, 5]:
+        frames, cpu = replay_renderer(tokens, fps)
+        print(f"{f'renderer {fps}fps':16} frames {frames:5}  cpu {cpu:6.2f}s")
@@ -0,0 +1,65 @@
+# 로컬 위키피디아 API 스텁으로 wiki_search 시간을 비교
+# 기존 방식: WikipediaRetriever처럼 검색 후 문서 5개를 하나씩 순서대로 받아옴
+# search_wikipedia: 문서를 동시에 받아오고 (제목, revision) 단위로 디스크에 캐시
+# 실행: python -m benchmarks.bench_wiki
+import json, os, tempfile, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import utils.wiki as wiki
+from utils.cache import DiskCache
+
+# 스텁 서버의 응답 지연 (실제 위키피디아 요청 한번과 비슷한 수준)
+LATENCY = 0.3
+TOP_K = 5
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        time.sleep(LATENCY)
+        if "list" in params:
+            body = {"query": {"search": [{"title": f"{params['srsearch']} {i}"} for i in range(TOP_K)]}}
+        elif params.get("prop") == "revisions":
+            titles = params["titles"].split("|")
+            body = {"query": {"pages": [{"title": title, "revisions": [{"revid": 1}]} for title in titles]}}
+        else:
+            title = params["titles"]
+            body = {"query": {"pages": [{"title": title, "extract": f"{title} 본문입니다. " * 500}]}}
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def search_before(term, api_url):
+    titles = wiki.search_titles(term, TOP_K, api_url)
+    return [wiki.fetch_content(title, api_url) for title in titles]
+
+
+def measure(name, search):
+    start = time.perf_counter()
+    docs = search()
+    print(f"{name:12} {time.perf_counter() - start:6.2f}s  ({len(docs)} docs)")
+
+
+if __name__ == "__main__":
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_url = f"http://127.0.0.1:{server.server_port}/w/api.php"
+
+    with tempfile.TemporaryDirectory() as folder:
+        wiki._cache = DiskCache(os.path.join(folder, "wikipedia.sqlite"), max_bytes=64 * 1024**2)
+        measure("before", lambda: search_before("Rome", api_url))
+        measure("cold", lambda: wiki.search_wikipedia("Rome", TOP_K, api_url))
+        measure("warm", lambda: wiki.search_wikipedia("Rome", TOP_K, api_url))
+        # revision 정보만 만료된 경우: revision id만 확인하고 본문은 캐시에서 읽음
+        for i in range(TOP_K):
+            wiki._cache.delete(f"revision:{api_url}:Rome {i}")
+        measure("revalidate", lambda: wiki.search_wikipedia("Rome", TOP_K, api_url))
+        wiki._cache.conn.close()
+    server.shutdown()
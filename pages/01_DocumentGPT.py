@@ -1,14 +1,15 @@
 from langchain.prompts import ChatPromptTemplate
-from langchain.document_loaders import UnstructuredFileLoader
 from langchain.embeddings import CacheBackedEmbeddings, OpenAIEmbeddings
 from langchain.schema.runnable import RunnableLambda, RunnablePassthrough
-from langchain.storage import LocalFileStore
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.vectorstores.faiss import FAISS
 from langchain.chat_models import ChatOpenAI
 from langchain.callbacks.base import BaseCallbackHandler
 import streamlit as st
-import requests, os
+import time, hashlib
+from utils.auth import is_valid
+from utils.streaming import StreamRenderer
+from utils.ingest import get_upload, IngestJob
+from utils.bytestore import SQLiteByteStore
+from utils.context import pack_docs
 
 st.set_page_config(
     page_title="DocumentGPT",
@@ -16,63 +17,56 @@ st.set_page_config(
 )
 
 class ChatCallbackHandler(BaseCallbackHandler):
-    message = ""
-
+    # 토큰마다 다시 그리지 않고 StreamRenderer가 모아서 그려줌
     def on_llm_start(self, *args, **kwargs):
-        self.message_box = st.empty()
+        self.renderer = StreamRenderer()
+        self.renderer.start()
 
     def on_llm_end(self, *args, **kwargs):
-        save_message(self.message, "ai")
+        self.renderer.flush()
+        save_message(self.renderer.text, "ai")
 
     def on_llm_new_token(self, token, *args, **kwargs):
-        self.message += token
-        self.message_box.markdown(self.message)
-
-
-def is_valid(key):
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {key}",
-    }
-    try:
-        response = requests.get(
-            "https://api.openai.com/v1/models", headers=headers)
-        if response.status_code == 200:
-            return True
-        else:
-            return False
-    except:
-        return False
+        self.renderer.write(token)
 
 
-# cache_data 사용시 UnserializableReturnValueError 가 발생하여 변경
-@st.cache_resource(show_spinner="파일 임베딩 중...")
-def embed_file(file, key):
-    # .cache 폴더가 없으면 생성해준다.
-    file_folder = './.cache/files'
-    
-    if not os.path.exists(file_folder):
-        os.makedirs(file_folder)
-
-    file_content = file.read()
-    file_path = f"{file_folder}/{file.name}"
-    # st.write(file_content, file_path)
-    with open(file_path, "wb") as f:
-        f.write(file_content)
-
-    cache_dir = LocalFileStore(f"./.cache/embeddings/{file.name}")
-    splitter = CharacterTextSplitter.from_tiktoken_encoder(
-        separator="\n",
-        chunk_size=600,
-        chunk_overlap=100,
-    )
-    loader = UnstructuredFileLoader(file_path)
-    docs = loader.load_and_split(text_splitter=splitter)
+# 처음 이만큼의 청크가 인덱싱되면 나머지 인덱싱을 기다리지 않고 질문을 받음
+READY_CHUNKS = 64
+# prompt에 넣을 context의 최대 토큰 수
+CONTEXT_TOKENS = 1500
+
+
+def get_embeddings(key):
+    # 임베딩 캐시는 청크 내용으로 키가 정해지므로 모든 문서가 하나의 저장소를 공유
+    # 임베딩은 float16으로 압축해서 SQLite 파일 하나에 저장
+    cache_dir = SQLiteByteStore("./.cache/embeddings/documents.sqlite", quantize="float16", max_bytes=1024**3)
     embeddings = OpenAIEmbeddings(api_key=key)
-    cached_embeddings = CacheBackedEmbeddings.from_bytes_store(embeddings, cache_dir)
-    vectorstore = FAISS.from_documents(docs, cached_embeddings)
-    retriever = vectorstore.as_retriever()
-    return retriever
+    return CacheBackedEmbeddings.from_bytes_store(embeddings, cache_dir)
+
+
+# cache_data 사용시 UnserializableReturnValueError 가 발생하여 변경
+# 파일명이 아닌 파일 내용의 해시(file_hashes)를 캐시 키로 사용
+# API key(_key)는 캐시 키에서 제외해서, 여러 사용자가 같은 파일을 올려도 파싱/임베딩은 한번만 수행
+# 인덱싱은 IngestJob의 백그라운드 스레드에서 진행되므로 바로 반환됨
+@st.cache_resource(show_spinner=False)
+def embed_files(file_hashes, file_paths, _key):
+    # 업로드한 파일 묶음 단위로 하나의 인덱스를 만듦
+    files_hash = hashlib.sha256("".join(sorted(file_hashes)).encode()).hexdigest()
+    return IngestJob(f"documents/{files_hash}", file_paths, get_embeddings(_key))
+
+
+# 질문을 받을 수 있을 때까지 인덱싱 진행 상황을 보여줌
+def wait_for_index(job):
+    with st.sidebar:
+        status = st.empty()
+    while not job.is_ready(READY_CHUNKS):
+        status.info(f"파일 임베딩 중... ({job.count}개 청크 완료)")
+        time.sleep(0.5)
+    if job.error:
+        status.error(f"파일 임베딩에 실패하였습니다. {job.error}")
+    elif not job.done:
+        status.info(f"파일 임베딩 중... ({job.count}개 청크 완료) 지금까지 인덱싱된 내용으로 답변합니다.")
+    return job.vectorstore is not None
 
 def save_message(message, role):
     st.session_state["messages"].append({"message": message, "role": role})
@@ -91,8 +85,9 @@ def paint_history():
             save=False,
         )
 
+# 검색된 청크의 겹치는 부분을 합치고, 관련도 순으로 CONTEXT_TOKENS 까지만 context에 넣음
 def format_docs(docs):
-    return "\n\n".join(document.page_content for document in docs)
+    return pack_docs(docs, CONTEXT_TOKENS)
 
 prompt = ChatPromptTemplate.from_messages(
     [
@@ -129,9 +124,10 @@ with st.sidebar:
             st.success("유효한 OPENAI_API_KEY 입니다.")
 
             try:
-                file = st.file_uploader(
+                files = st.file_uploader(
                     "TXT, PDF, DOCX 확장자를 가진 파일을 업로드하세요.",
                     type=["pdf", "txt", "docx"],
+                    accept_multiple_files=True,
                 )
             except:
                 st.error("파일 업로드에 실패하였습니다.")
@@ -148,8 +144,16 @@ if key:
         api_key=key
     )
 
-    if file:
-        retriever = embed_file(file, key)
+    if files:
+        # 업로드 순서가 달라도 같은 파일 묶음이면 같은 캐시 항목(IngestJob)을 사용하도록 해시 순으로 정렬
+        file_hashes, file_paths = zip(*sorted(get_upload(file) for file in files))
+        job = embed_files(file_hashes, file_paths, key)
+        # 실패한 작업도 캐시에 남아있으므로, API 오류로 실패했다면 다음 rerun에서 현재 API key로 다시 시도
+        if job.done and job.error and job.is_retryable():
+            job.retry(get_embeddings(key))
+        if not wait_for_index(job):
+            st.stop()
+        retriever = job.as_retriever(OpenAIEmbeddings(api_key=key))
         send_message("반갑습니다! 질문해 주세요. ^^", "ai", save=False)
         paint_history()
         message = st.chat_input("문서에 대해 질문해 주세요.")
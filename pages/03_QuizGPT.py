@@ -1,13 +1,17 @@
-import json, requests, os
+import json, math, queue, threading
+from concurrent.futures import ThreadPoolExecutor
 
-from langchain.document_loaders import UnstructuredFileLoader
-from langchain.text_splitter import CharacterTextSplitter
 from langchain.chat_models import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate, PromptTemplate
 from langchain.schema.runnable import RunnableLambda, RunnablePassthrough
 import streamlit as st
-from langchain.retrievers import WikipediaRetriever
 from langchain.schema import BaseOutputParser
+from utils.auth import is_valid
+from utils.cache import DiskCache
+from utils.ingest import get_upload, iter_chunks, make_splitter
+from utils.context import sample_sections
+from utils.jsonstream import ArrayItemParser
+from utils.wiki import search_wikipedia
 
 
 class JsonOutputParser(BaseOutputParser):
@@ -57,66 +61,175 @@ function = {
 }
 
 
-
-def is_valid(key):
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {key}",
-    }
-    try:
-        response = requests.get(
-            "https://api.openai.com/v1/models", headers=headers)
-        if response.status_code == 200:
-            return True
-        else:
-            return False
-    except:
-        return False
-
-
 def format_docs(docs):
     return "\n\n".join(document.page_content for document in docs)
 
 
+# 파일명이 아닌 파일 내용의 해시(file_hash)를 캐시 키로 사용
 @st.cache_data(show_spinner="파일 로딩 중...")
-def split_file(file):
-    # .cache 폴더가 없으면 생성해준다.
-    file_folder = './.cache/files'
-    
-    if not os.path.exists(file_folder):
-        os.makedirs(file_folder)
-
-    file_content = file.read()
-    file_path = f"{file_folder}/{file.name}"
-    with open(file_path, "wb") as f:
-        f.write(file_content)
-    splitter = CharacterTextSplitter.from_tiktoken_encoder(
-        separator="\n",
-        chunk_size=600,
-        chunk_overlap=100,
-    )
-    loader = UnstructuredFileLoader(file_path)
-    docs = loader.load_and_split(text_splitter=splitter)
+def split_file(file_hash, file_path):
+    docs = list(iter_chunks(file_path, make_splitter()))
     return docs
 
 
-@st.cache_data(show_spinner="위키피디아 검색 중...")
+# 문서는 utils.wiki에서 동시에 받아오고 디스크에 캐시하므로, 여기서는 프로세스 안에서 짧게만 보관
+@st.cache_data(show_spinner="위키피디아 검색 중...", ttl=600)
 def wiki_search(term):
-    retriever = WikipediaRetriever(top_k_results=5)
-    docs = retriever.get_relevant_documents(term)
-    return docs
+    return search_wikipedia(term, top_k=5)
+
+
+# 퀴즈 생성에 사용할 context의 최대 토큰 수와, 한 번의 LLM 호출에 넣을 구간 수
+# 문서가 길어져도 토큰 사용량과 생성 시간이 늘어나지 않도록 문서 전체에서 고르게 뽑은 청크만 사용
+QUIZ_CONTEXT_TOKENS = 6000
+QUIZ_SECTIONS = 4
+QUIZ_CONCURRENCY = 4
+
 
+def normalize_question(question):
+    return " ".join(question["question"].lower().split())
 
-# streamlit의 캐시 함수에 변경 가능(mutable)한 parameter를 전달하면 해시할 수 없어서 오류가 발생함
-# docs는 list이고 변경 가능하므로 해시 불가하므로, _를 붙여줘서 오류 방지
-# 캐시 함수에 활용할 parameter가 필요하므로, topic(여기서는 검색어 혹은 파일명)을 추가해줘서 캐시 기능을 완성
-@st.cache_data(show_spinner="퀴즈 생성 중...")
-def run_quiz_chain(_docs, topic, total_count, difficulty):
+
+# 생성이 끝난 퀴즈를 모든 세션이 공유하는 저장소
+# [topic, total_count, difficulty] -> {"questions": [...]}
+# 일주일이 지나거나 전체 용량이 QUIZ_STORE_BYTES를 넘으면 오래된 퀴즈부터 삭제
+QUIZ_STORE_TTL = 60 * 60 * 24 * 7
+QUIZ_STORE_BYTES = 64 * 1024**2
+
+
+@st.cache_resource
+def quiz_store():
+    return DiskCache("./.cache/quizzes.sqlite", ttl=QUIZ_STORE_TTL, max_bytes=QUIZ_STORE_BYTES)
+
+
+def quiz_store_key(quiz_key):
+    return json.dumps(quiz_key, ensure_ascii=False)
+
+
+# 문서를 구간으로 나누어 구간별 문제를 동시에 만들고(map), 중복을 제거하며 합침(reduce)
+# 함수 호출 인자를 스트리밍으로 받아서, 문제 하나가 완성될 때마다 바로 반환하므로
+# 전체 퀴즈가 완성되기 전에 첫 문제부터 화면에 그릴 수 있음
+# 구간별 생성 중 발생한 예외는 errors에 모아서 호출한 쪽에서 보여줄 수 있도록 함
+def stream_quiz(docs, total_count, difficulty, errors):
     prompt = PromptTemplate.from_template("{context}에 대한 퀴즈를 {total_count}개 만들어줘. 한글로 작성해줘. 난이도는 {difficulty}")
-    # chain = {"context": _docs | RunnableLambda(format_docs)} | prompt | llm
     chain = prompt | llm
-    # return chain.invoke(_docs)
-    return chain.invoke({"context": _docs, "total_count": total_count,  "difficulty": difficulty})
+    sections = sample_sections(docs, QUIZ_CONTEXT_TOKENS, min(QUIZ_SECTIONS, total_count))
+    # 문서 전체에서 고르게 출제되도록 구간별로 quota 개까지만 먼저 사용하고,
+    # 중복 제거나 실패에 대비해서 구간별로 1개씩 여유있게 생성한 문제는 마지막에 부족한 만큼 채움
+    quota = math.ceil(total_count / len(sections))
+    results = queue.Queue()
+    # 필요한 문제 수를 채웠거나 화면에서 더이상 읽지 않으면, 남은 구간의 스트리밍을 중단해서 토큰을 아낌
+    stop = threading.Event()
+
+    def generate(index, section):
+        parser = ArrayItemParser("questions")
+        try:
+            for chunk in chain.stream({"context": section, "total_count": quota + 1, "difficulty": difficulty}):
+                if stop.is_set():
+                    break
+                arguments = chunk.additional_kwargs.get("function_call", {}).get("arguments", "")
+                for question in parser.feed(arguments):
+                    results.put((index, question))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            results.put((index, None))
+
+    pool = ThreadPoolExecutor(max_workers=QUIZ_CONCURRENCY)
+    for index, section in enumerate(sections):
+        pool.submit(generate, index, section)
+    pool.shutdown(wait=False)
+
+    seen = set()
+    accepted = [0] * len(sections)
+    reserve = []
+    finished = 0
+    emitted = 0
+    try:
+        while finished < len(sections) and emitted < total_count:
+            index, question = results.get()
+            if question is None:
+                finished += 1
+            elif normalize_question(question) in seen:
+                continue
+            elif accepted[index] < quota:
+                seen.add(normalize_question(question))
+                accepted[index] += 1
+                emitted += 1
+                yield question
+            else:
+                reserve.append(question)
+    finally:
+        stop.set()
+
+    for question in reserve:
+        if emitted == total_count:
+            break
+        if normalize_question(question) not in seen:
+            seen.add(normalize_question(question))
+            emitted += 1
+            yield question
+
+
+# 퀴즈 풀이/채점 영역만 fragment로 분리해서, 제출 버튼을 눌러도 이 함수만 다시 실행됨
+# is_valid, ChatOpenAI 생성, 파일/위키피디아 로딩 등 페이지 전체는 다시 실행되지 않고,
+# 퀴즈는 session_state에 파싱된 상태로 보관하므로 채점만 수행
+@st.fragment
+def quiz_form(topic, docs, total_count, difficulty):
+    # current: 현재퀴즈번호, count: 정답수
+    current = 0
+    count = 0
+    quiz_key = (topic, total_count, difficulty)
+    quiz = st.session_state.get("quiz")
+    if quiz is None or quiz["key"] != quiz_key:
+        # 이미 만든 퀴즈가 있으면 재사용하고, 없으면 생성되는 대로 한 문제씩 그림
+        quiz = quiz_store().get(quiz_store_key(quiz_key))
+    questions = []
+    errors = []
+
+    st.markdown(
+        """<style>
+            div[class*="stRadio"] > label > div[data-testid="stMarkdownContainer"] > p {
+                font-size: 18px;
+            }
+        </style>
+        """, unsafe_allow_html=True
+    )
+    with st.form("questions_form"):
+        for question in quiz["questions"] if quiz else stream_quiz(docs, total_count, difficulty, errors):
+            questions.append(question)
+            current = current + 1
+            value = st.radio(
+                f'Q{current}. {question["question"]}',
+                [answer["answer"] for answer in question["answers"]],
+                index=None, horizontal=True
+            )
+
+            if {"answer": value, "correct": True} in question["answers"]:
+                st.success(f"Correct! ({value})")
+                count = count + 1
+            elif value is not None:
+                st.error("Wrong!")
+
+        # 일부 구간의 생성이 실패해서 문제가 모자란 퀴즈는 저장하지 않고, 다음 실행 때 다시 생성
+        if len(questions) < total_count:
+            message = f"퀴즈를 {len(questions)} / {total_count}개만 만들었습니다."
+            if errors:
+                message += f" ({errors[0]})"
+            st.error(message)
+            st.form_submit_button(label="다시 만들기", use_container_width=True)
+            return
+        if quiz is None:
+            quiz_store().set(quiz_store_key(quiz_key), {"questions": questions})
+        st.session_state["quiz"] = {"key": quiz_key, "questions": questions}
+
+        button = st.form_submit_button(label="제출", type="primary", use_container_width=True, disabled=(True if count == total_count else False))
+
+        if button:
+            if count == total_count:
+                st.info("만점이에요. 축하합니다!", icon="✅")
+                st.balloons()
+            else:
+                st.warning(f"정답개수 : {count} / {total_count}. 다시 풀어보세요!", icon="❌")
 
 
 st.set_page_config(
@@ -131,14 +244,11 @@ with st.sidebar:
     Github Repo : https://github.com/ggomdong/streamlit-gpt
     """)
     # 변수 초기화
-    # difficulty: 난이도, total_count: 퀴즈 갯수, current: 현재퀴즈번호, count: 정답수
+    # difficulty: 난이도, total_count: 퀴즈 갯수
     docs = None
     topic = None
     difficulty = None
     total_count = 0
-    current = 0
-    count = 0
-    button = None
 
     key = st.text_input("OPEN_API_KEY", placeholder="OPENAI_API_KEY를 입력해주세요.", type="password")
 
@@ -184,7 +294,8 @@ with st.sidebar:
                         type=["pdf", "txt", "docx"],
                     )
                     if file:
-                        docs = split_file(file)
+                        file_hash, file_path = get_upload(file)
+                        docs = split_file(file_hash, file_path)
                 except:
                     st.error("파일 업로드에 실패하였습니다.")
             else:
@@ -205,38 +316,4 @@ if not docs:
         """
     )
 else:
-    response = run_quiz_chain(docs, topic if topic else file.name, total_count, difficulty)
-    response = response.additional_kwargs["function_call"]["arguments"]
-    # with st.container():
-    with st.form("questions_form"):
-        for question in json.loads(response)["questions"]:
-            current = current + 1
-            # st.write(f'{total_count}. {question["question"]}')
-            value = st.radio(
-                f'Q{current}. {question["question"]}',
-                [answer["answer"] for answer in question["answers"]],
-                index=None, horizontal=True
-            )
-            st.markdown(
-                """<style>
-                    div[class*="stRadio"] > label > div[data-testid="stMarkdownContainer"] > p {
-                        font-size: 18px;
-                    }
-                </style>
-                """, unsafe_allow_html=True
-            )
-            
-            if {"answer": value, "correct": True} in question["answers"]:
-                st.success(f"Correct! ({value})")
-                count = count + 1
-            elif value is not None:
-                st.error("Wrong!")
-
-        button = st.form_submit_button(label="제출", type="primary", use_container_width=True, disabled=(True if count == total_count else False))
-
-        if button:
-            if count == total_count:
-                st.info("만점이에요. 축하합니다!", icon="✅")
-                st.balloons()
-            else:
-                st.warning(f"정답개수 : {count} / {total_count}. 다시 풀어보세요!", icon="❌")
\ No newline at end of file
+    quiz_form(topic if topic else file_hash, docs, total_count, difficulty)
@@ -1,45 +1,34 @@
-from langchain.document_loaders import SitemapLoader
 from langchain.schema.runnable import RunnableLambda, RunnablePassthrough
-from langchain.storage import LocalFileStore
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.vectorstores.faiss import FAISS
 from langchain.embeddings import OpenAIEmbeddings, CacheBackedEmbeddings
 from langchain.chat_models import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from langchain.callbacks.base import BaseCallbackHandler
+from langchain.schema import AIMessage
 import streamlit as st
-import requests, os
+import hashlib, json, math, re
+from utils.auth import is_valid
+from utils.streaming import StreamRenderer
+from utils.vectorstore import load_index
+from utils.site import sync_site
+from utils.extract import Extractor
+from utils.cache import DiskCache
+from utils.bytestore import SQLiteByteStore
 
 
 class ChatCallbackHandler(BaseCallbackHandler):
-    message = ""
-
+    # 토큰마다 다시 그리지 않고 StreamRenderer가 모아서 그려줌
     def on_llm_start(self, *args, **kwargs):
-        self.message_box = st.empty()
+        self.renderer = StreamRenderer()
+        self.renderer.start()
 
     def on_llm_end(self, *args, **kwargs):
-        save_message(self.message, "ai")
+        self.renderer.flush()
+        save_message(self.renderer.text, "ai")
 
     def on_llm_new_token(self, token, *args, **kwargs):
-        self.message += token
-        self.message_box.markdown(self.message)
-
+        self.renderer.write(token)
 
-def is_valid(key):
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {key}",
-    }
-    try:
-        response = requests.get(
-            "https://api.openai.com/v1/models", headers=headers)
-        if response.status_code == 200:
-            return True
-        else:
-            return False
-    except:
-        return False
-    
 
 answers_prompt = ChatPromptTemplate.from_template(
     """
@@ -67,22 +56,79 @@ answers_prompt = ChatPromptTemplate.from_template(
 )
 
 
+LLM_MODEL = "gpt-4o-mini-2024-07-18"
+# map 단계에서 동시에 호출할 최대 LLM 요청 수와 요청당 timeout(초)
+ANSWERS_CONCURRENCY = 4
+ANSWERS_TIMEOUT = 20
+# 검색할 문서 수와, LLM에 보낼 최소 유사도(relevance score, 0~1)
+# 유사도가 이보다 낮은 문서는 답을 포함하지 않을 가능성이 높으므로 LLM 호출 없이 제외
+RETRIEVE_K = 4
+MIN_RELEVANCE = 0.6
+
+
+# 유사도 점수와 함께 문서를 검색하고, MIN_RELEVANCE 미만인 문서는 제외
+# 인덱스는 모든 사용자가 공유하므로, 질문 임베딩은 현재 사용자의 key(query_embeddings)로 계산
+def retrieve_docs(question):
+    embedding = query_embeddings.embed_query(question)
+    docs_and_scores = vector_store.similarity_search_with_score_by_vector(embedding, k=RETRIEVE_K)
+    # FAISS는 L2 거리를 반환하므로 langchain과 같은 방식으로 0~1의 relevance score로 변환
+    return [doc for doc, distance in docs_and_scores if 1 - distance / math.sqrt(2) >= MIN_RELEVANCE]
+
+
+# answers_prompt의 형식대로 "score: N" 을 읽어옴. 없으면 None
+def parse_score(answer):
+    match = re.search(r"score:\s*(\d+)", answer, re.IGNORECASE)
+    return int(match.group(1)) if match else None
+
+
+# 같은 (질문, 청크) 쌍의 map 결과를 디스크에 저장해서 재사용
+# 키에 prompt 버전, 모델, 청크 내용 해시, 페이지의 lastmod를 포함하므로 어느 하나라도 바뀌면 새로 호출함
+ANSWERS_PROMPT_VERSION = "v1"
+@st.cache_resource
+def get_answer_cache():
+    return DiskCache("./.cache/answers.sqlite", ttl=60 * 60 * 24 * 7, max_bytes=256 * 1024**2)
+
+
+def answer_cache_key(question, doc):
+    normalized = " ".join(question.lower().split())
+    content_hash = hashlib.sha256(doc.page_content.encode()).hexdigest()
+    key = [ANSWERS_PROMPT_VERSION, LLM_MODEL, normalized, content_hash, doc.metadata["source"], doc.metadata["lastmod"]]
+    return hashlib.sha256(json.dumps(key, ensure_ascii=False).encode()).hexdigest()
+
+
 def get_answers(inputs):
     docs = inputs["docs"]
     question = inputs["question"]
-    # Map Re Rank의 과정은 출력하지 않기 위해 streaming 하지 않는 llm 사용
-    answers_chain = answers_prompt | llm
+    answer_cache = get_answer_cache()
+    keys = [answer_cache_key(question, doc) for doc in docs]
+    contents = [answer_cache.get(key) for key in keys]
+    missing = [i for i, content in enumerate(contents) if content is None]
+
+    if missing:
+        # Map Re Rank의 과정은 출력하지 않기 위해 streaming 하지 않는 llm 사용
+        answers_chain = answers_prompt | llm
+        # 문서별 호출을 동시에 수행하고, 실패하거나 timeout 된 문서는 제외하고 나머지 결과만 사용
+        results = answers_chain.batch(
+            [{"question": question, "context": docs[i].page_content} for i in missing],
+            config={"max_concurrency": ANSWERS_CONCURRENCY},
+            return_exceptions=True,
+        )
+        for i, result in zip(missing, results):
+            if not isinstance(result, Exception):
+                contents[i] = result.content
+                answer_cache.set(keys[i], result.content)
+
+    # score가 0인 대답("모릅니다")은 최종 대답에 도움이 되지 않으므로 choose_prompt에 넣지 않음
     return {
         "question": question,
         "answers": [
             {
-                "answer": answers_chain.invoke(
-                    {"question": question, "context": doc.page_content}
-                ).content,
+                "answer": content,
                 "source": doc.metadata["source"],
                 "date": doc.metadata["lastmod"],
             }
-            for doc in docs
+            for doc, content in zip(docs, contents)
+            if content is not None and parse_score(content) != 0
         ],
     }
 
@@ -104,9 +150,18 @@ choose_prompt = ChatPromptTemplate.from_messages(
 )
 
 
+# 관련도가 낮은 문서만 검색됐거나 모든 대답의 score가 0이면 LLM 호출 없이 보내는 대답
+NO_ANSWER = "문서에서 질문에 대한 답을 찾지 못했습니다. 모릅니다."
+
+
 def choose_answer(inputs):
     answers = inputs["answers"]
     question = inputs["question"]
+    # 사용할 대답이 없으면 choose_prompt를 호출해도 답할 수 없으므로 바로 대답
+    if not answers:
+        st.markdown(NO_ANSWER)
+        save_message(NO_ANSWER, "ai")
+        return AIMessage(content=NO_ANSWER)
     # 최종 결과는 출력을 위해 streaming 하는 llm_streaming 사용
     choose_chain = choose_prompt | llm_streaming
     condensed = "\n\n".join(
@@ -121,46 +176,51 @@ def choose_answer(inputs):
     )
 
 
-def parse_page(soup):
-    # Cloudflare의 경우 <main> 태그에 컨텐츠가 포함됨
-    return (
-        str(soup.find("main").get_text())
-        .replace("\n", " ")
-        .replace("\xa0", " ")
-        .replace("Edit page   Cloudflare DashboardDiscordCommunityLearning CenterSupport Portal  Cookie Settings", "")
-    )
+# Cloudflare의 경우 <main> 태그에 컨텐츠가 포함됨
+# "Edit page", Discord/Community 링크 등은 <main> 안의 <footer>에 들어있으므로 선택자로 제거
+parse_page = Extractor(
+    target="main",
+    remove_selectors=["footer", "nav", "script", "style"],
+)
 
 
-@st.cache_resource(show_spinner="웹사이트 로딩 중...")
-def load_website(url, key):
-    # .cache 폴더가 없으면 생성해준다.
-    file_folder = './.cache/embeddings/site'
-    
-    if not os.path.exists(file_folder):
-        os.makedirs(file_folder)
+# 아래 3개의 URL만 대상으로 함
+FILTER_URLS = [
+    'https://developers.cloudflare.com/ai-gateway/',
+    'https://developers.cloudflare.com/vectorize/',
+    'https://developers.cloudflare.com/workers-ai/',
+]
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
 
-    cache_dir = LocalFileStore(f"{file_folder}")
+# 사이트맵 URL, 대상 URL 목록, 임베딩 모델이 같으면 같은 인덱스를 사용
+def site_index_name(url):
+    site_hash = hashlib.sha256("\n".join([url, *FILTER_URLS, EMBEDDING_MODEL]).encode()).hexdigest()
+    return f"sites/{site_hash}"
 
+
+def sync_website(url, key):
+    # 임베딩은 float16으로 압축해서 SQLite 파일 하나에 저장
+    cache_dir = SQLiteByteStore("./.cache/embeddings/site.sqlite", quantize="float16", max_bytes=1024**3)
+    embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL, api_key=key)
+    cached_embeddings = CacheBackedEmbeddings.from_bytes_store(embeddings, cache_dir)
     splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
         chunk_size=1000,
         chunk_overlap=200,
     )
-    loader = SitemapLoader(
-        url,
-        parsing_function=parse_page,
-        # 아래 3개의 URL만 대상으로 함
-        filter_urls=[
-            'https://developers.cloudflare.com/ai-gateway/',
-            'https://developers.cloudflare.com/vectorize/',
-            'https://developers.cloudflare.com/workers-ai/',
-        ]
-    )
-    loader.requests_per_second = 2
-    docs = loader.load_and_split(text_splitter=splitter)
-    embeddings = OpenAIEmbeddings(api_key=key)
-    cached_embeddings = CacheBackedEmbeddings.from_bytes_store(embeddings, cache_dir)
-    vector_store = FAISS.from_documents(docs, cached_embeddings)
-    return vector_store.as_retriever()
+    return sync_site(site_index_name(url), url, FILTER_URLS, splitter, cached_embeddings, parse_page)
+
+
+# 이미 만들어진 인덱스가 디스크에 있으면 재시작 후에도 크롤링/임베딩 없이 바로 불러옴
+# 저장된 인덱스가 없을 때만 전체 크롤링을 수행
+# _key는 인덱스를 처음 만들 때의 임베딩에만 사용하고 캐시 키에서는 제외하므로,
+# 접속한 사용자 수와 관계없이 사이트별로 하나의 인덱스만 메모리에 올라감
+@st.cache_resource(show_spinner="웹사이트 로딩 중...")
+def load_website(url, _key):
+    vector_store = load_index(site_index_name(url), OpenAIEmbeddings(model=EMBEDDING_MODEL, api_key=_key))
+    if vector_store is None:
+        vector_store = sync_website(url, _key)
+    return vector_store
 
 
 def save_message(message, role):
@@ -216,20 +276,30 @@ with st.sidebar:
             # 따라서, llm을 2개로 분리하여, get_answers()는 streaming을 하지 않고, choose_answer는 streaming 처리
             llm = ChatOpenAI(
                 temperature=0.1,
-                model="gpt-4o-mini-2024-07-18",
+                model=LLM_MODEL,
                 # streaming=True,
                 # callbacks=[ChatCallbackHandler(),],
+                request_timeout=ANSWERS_TIMEOUT,
+                max_retries=1,
                 api_key=key
             )
 
             llm_streaming = ChatOpenAI(
                 temperature=0.1,
-                model="gpt-4o-mini-2024-07-18",
+                model=LLM_MODEL,
                 streaming=True,
                 callbacks=[ChatCallbackHandler(),],
                 api_key=key
             )
 
+            query_embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL, api_key=key)
+
+            # 사이트맵의 lastmod를 기준으로 새로 생기거나 바뀐 페이지만 다시 받아서 인덱스에 반영
+            if st.button("문서 새로고침"):
+                with st.spinner("변경된 문서 반영 중..."):
+                    sync_website(url, key)
+                load_website.clear()
+
             ############ 여기서는 URL을 고정시켰으므로, URL 입력 부분은 주석 처리
             # url = st.text_input(
             #     "URL을 입력하세요.", "",
@@ -259,7 +329,7 @@ if key:
     #     with st.sidebar:
     #         st.error("Sitemap URL로 작성해 주세요.")
     # else:
-    retriever = load_website(url, key)
+    vector_store = load_website(url, key)
 
     send_message("반갑습니다! 질문해 주세요. ^^", "ai", save=False)
     paint_history()
@@ -268,7 +338,7 @@ if key:
         send_message(message, "human")
         chain = (
             {
-                "docs": retriever,
+                "docs": RunnableLambda(retrieve_docs),
                 "question": RunnablePassthrough(),
             }
             | RunnableLambda(get_answers)
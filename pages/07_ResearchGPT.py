@@ -1,102 +1,95 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib, threading
 from typing_extensions import override
 from openai import AssistantEventHandler
-from openai import OpenAI
+from openai import NotFoundError, OpenAI
 import streamlit as st
-import requests, json
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import json
+from utils.auth import is_valid
+from utils.cache import DiskCache
+from utils.deadline import Deadline
 from utils import functions
+from utils.streaming import StreamRenderer
+
+# 한 step에서 동시에 실행할 함수 수와 함수 하나의 제한 시간(초)
+TOOL_CONCURRENCY = 4
+TOOL_TIMEOUT = 30
+# 질문 하나에서 도구 호출에 사용할 수 있는 전체 시간(초)
+RUN_BUDGET = 90
 
 
 ############## streaming 처리를 위한 클래스
 # 참고 : https://platform.openai.com/docs/assistants/tools/function-calling/step-3-initiate-a-run
 class EventHandler(AssistantEventHandler):
 
+    # 한 번의 질문(run)에서 이어지는 모든 도구 호출이 같은 시간 예산을 나눠 사용
+    def __init__(self, deadline):
+        super().__init__()
+        self.deadline = deadline
+
     # 질문이 부실하거나 명확하지 않은 경우, 일반적인 답변을 streaming하기 위한 함수 제공
     # 예시 질의: fasfsafasfsakfasklfhaskhfdsakj
     @override
     def on_text_created(self, text) -> None:
-        self.message_box = st.empty()
+        # delta마다 다시 그리지 않고 StreamRenderer가 모아서 그려줌
+        self.renderer = StreamRenderer()
+        self.renderer.start()
         
     def on_text_delta(self, delta, snapshot):
-        self.message_box.markdown(snapshot.value)
+        self.renderer.update(snapshot.value)
 
     def on_text_done(self, text):
+        self.renderer.update(text.value)
+        self.renderer.flush()
         save_message(text.value, "ai")
     
     #run의 status가 requires_action 일때 처리하는 로직 정의
     def on_event(self, event):
         # print(event.event)
         if event.event == "thread.run.requires_action":
-            # submit 등 이후 처리를 위해 run.id를 event에서 가져옴
-            run_id = event.data.id
-            self.submit_tool_outputs(run_id, thread.id)
-
-    # run의 정보를 가져옴
-    def get_run(self, run_id, thread_id):
-        return client.beta.threads.runs.retrieve(
-            run_id=run_id,
-            thread_id=thread_id,
-        )
-    
-    # required_action에서 요구되는 함수가 실행될 수 있도록 매핑 수행
-    def get_tool_outputs(self, run_id, thread_id):
-        run = self.get_run(run_id, thread.id)
-        outputs = []
-
-        for action in run.required_action.submit_tool_outputs.tool_calls:
-            action_id = action.id
-            function = action.function
-            outputs.append(
-                {
-                    "output": functions.functions_map[function.name](json.loads(function.arguments)),
-                    "tool_call_id": action_id,
-                }
-            )
-        return outputs
+            # event에 담긴 run을 그대로 사용해서 run을 다시 조회하지 않음
+            self.submit_tool_outputs(event.data, thread.id)
+
+    # 함수 하나를 run의 남은 시간 예산과 TOOL_TIMEOUT 중 짧은 시간 안에 실행
+    # 시간이 초과되거나 실패하면 결과 대신 assistant에게 전달할 문자열을 받음
+    def run_tool(self, action):
+        timeout = min(TOOL_TIMEOUT, self.deadline.remaining())
+        return functions.run_tool(action.function.name, action.function.arguments, timeout)
+
+    # required_action에서 요구되는 함수들을 스레드 풀에서 동시에 실행
+    # 각 함수는 제한 시간 안에 항상 결과 문자열을 반환하므로, 한 step의 시간은
+    # 모든 함수 실행 시간의 합이 아니라 가장 느린 함수 정도로 제한됨
+    def get_tool_outputs(self, run):
+        tool_calls = run.required_action.submit_tool_outputs.tool_calls
+        # save_file 등 streamlit 요소를 그리는 함수가 있으므로 풀의 스레드에 script context를 연결
+        ctx = get_script_run_ctx()
+        with ThreadPoolExecutor(
+            max_workers=min(len(tool_calls), TOOL_CONCURRENCY),
+            initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx),
+        ) as pool:
+            outputs = list(pool.map(self.run_tool, tool_calls))
+        return [
+            {"output": output, "tool_call_id": action.id}
+            for action, output in zip(tool_calls, outputs)
+        ]
     
     # get_tool_outputs()를 통해 가져온 정보를 streaming 처리
-    def submit_tool_outputs(self, run_id, thread_id):
-        outputs = self.get_tool_outputs(run_id, thread_id)
+    def submit_tool_outputs(self, run, thread_id):
+        outputs = self.get_tool_outputs(run)
         with client.beta.threads.runs.submit_tool_outputs_stream(
-            run_id=run_id,
+            run_id=run.id,
             thread_id=thread_id,
             tool_outputs=outputs,
-            event_handler=EventHandler(),
+            event_handler=EventHandler(self.deadline),
         ) as stream:
             stream.until_done()
  
 
-############## OPENAI_API_KEY 정합성 체크
-def is_valid(key):
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {key}",
-    }
-    try:
-        response = requests.get(
-            "https://api.openai.com/v1/models", headers=headers)
-        if response.status_code == 200:
-            return True
-        else:
-            return False
-    except:
-        return False
-    
-
 ############## assistant 생성
-def init_assistant():
-    ASSISTANT_NAME = "ggomdong's Research Assistant v1.0"
-
-    # 동일한 assistant가 여러개 생성되는 것을 방지하기 위해 기존 assistant 정보를 가져옴
-    # 동일한 assistant가 존재할 경우 해당 assistant를 반환
-    my_assistants = client.beta.assistants.list(order="desc", limit="20")
-    for assistant in my_assistants:
-        if assistant.name == ASSISTANT_NAME:
-            return client.beta.assistants.retrieve(assistant.id)
-    
-    # 없으면 신규로 생성
-    assistant = client.beta.assistants.create(
-        name="ggomdong's Research Assistant v1.0",
-        instructions="""
+ASSISTANT_NAME = "ggomdong's Research Assistant v1.0"
+ASSISTANT_MODEL = "gpt-4o-mini-2024-07-18"
+ASSISTANT_INSTRUCTIONS = """
         당신은 웹사이트 검색 및 조사 전문가입니다.
 
         사용자의 질의에 대해 Wikipedia 또는 DuckDuckGo 에서 완전하고 정확한 정보를 수집합니다.
@@ -111,12 +104,89 @@ def init_assistant():
         링크와 출처는 가장 마지막에 표기합니다. 관련 링크 예시) Wikipedia: https://en.wikipedia.org/wiki/PlayStation_4
 
         최종 답변은 모든 출처와 관련 링크를 포함해 변경없이 동일하게 .txt 파일에 저장해야 합니다.
-        """,
+        """
+
+
+# instructions, tools(functions 스키마), model이 바뀌면 달라지는 해시
+def assistant_config_hash():
+    config = {
+        "instructions": ASSISTANT_INSTRUCTIONS,
+        "tools": functions.functions,
+        "model": ASSISTANT_MODEL,
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+
+@st.cache_resource
+def get_assistant_cache():
+    return DiskCache("./.cache/assistants.sqlite")
+
+
+# 설정이 바뀐 assistant는 새로 만들지 않고 그 자리에서 수정
+def update_assistant(assistant_id, config_hash):
+    return client.beta.assistants.update(
+        assistant_id,
+        instructions=ASSISTANT_INSTRUCTIONS,
         tools=functions.functions,
-        model="gpt-4o-mini-2024-07-18"
+        model=ASSISTANT_MODEL,
+        metadata={"config_hash": config_hash},
     )
 
-    return assistant
+
+# assistant id를 (API key 해시, 이름, 설정 해시) 단위로 프로세스와 디스크에 캐시해서
+# 새 브라우저 세션마다 assistant 목록을 조회하지 않음
+# 디스크에는 (API key 해시, 이름) 별로 id와 설정 해시를 저장하고, 설정이 바뀌었으면 수정 후 갱신
+@st.cache_resource(show_spinner="assistant 준비 중...")
+def init_assistant(key_hash, name, config_hash):
+    cache = get_assistant_cache()
+    cache_key = f"{key_hash}:{name}"
+    cached = cache.get(cache_key)
+    if cached:
+        if cached["config_hash"] == config_hash:
+            return cached["id"]
+        try:
+            assistant = update_assistant(cached["id"], config_hash)
+            cache.set(cache_key, {"id": assistant.id, "config_hash": config_hash})
+            return assistant.id
+        except NotFoundError:
+            # 다른 곳에서 삭제된 assistant면 아래에서 다시 찾거나 새로 생성
+            cache.delete(cache_key)
+
+    # 동일한 assistant가 여러개 생성되는 것을 방지하기 위해 기존 assistant를 모든 페이지에서 찾음
+    for assistant in client.beta.assistants.list(order="desc", limit=100):
+        if assistant.name == name:
+            if (assistant.metadata or {}).get("config_hash") != config_hash:
+                assistant = update_assistant(assistant.id, config_hash)
+            break
+    else:
+        # 없으면 신규로 생성
+        assistant = client.beta.assistants.create(
+            name=name,
+            instructions=ASSISTANT_INSTRUCTIONS,
+            tools=functions.functions,
+            model=ASSISTANT_MODEL,
+            metadata={"config_hash": config_hash},
+        )
+
+    cache.set(cache_key, {"id": assistant.id, "config_hash": config_hash})
+    return assistant.id
+
+
+# 디스크와 프로세스의 assistant 캐시를 모두 지움
+def forget_assistant(key_hash, name):
+    get_assistant_cache().delete(f"{key_hash}:{name}")
+    init_assistant.clear()
+
+
+def stream_run(thread_id, assistant_id):
+    with client.beta.threads.runs.stream(
+        thread_id=thread_id,
+        assistant_id=assistant_id,
+        event_handler=EventHandler(Deadline(RUN_BUDGET)),
+        ) as stream:
+        with st.chat_message("ai"):
+            with st.spinner("처리중..."):
+                stream.until_done()
 
 
 ############## 챗봇 메시지 처리를 위한 함수
@@ -169,21 +239,18 @@ with st.sidebar:
             st.warning("올바른 OPENAI_API_KEY를 입력하세요.")
             key = ""
 
+    # 도구 호출 결과 캐시의 이 프로세스 기준 적중/실패 횟수
+    st.caption(f"검색 캐시: 적중 {functions.tool_cache.hits}회 / 실패 {functions.tool_cache.misses}회")
+
 if key:
     client = OpenAI(
         api_key=key
     )
 
-    # assistant 초기화
-    if "assistant" not in st.session_state:
-        assistant = init_assistant()
-        thread = client.beta.threads.create()
-        
-        st.session_state["assistant"] = assistant
-        st.session_state["thread"] = thread
-    else:
-        assistant = st.session_state["assistant"]
-        thread = st.session_state["thread"]
+    # assistant id는 캐시에서 가져오고, thread는 첫 질문을 보낼 때 생성
+    key_hash = hashlib.sha256(key.encode()).hexdigest()
+    assistant_id = init_assistant(key_hash, ASSISTANT_NAME, assistant_config_hash())
+    thread = st.session_state.get("thread")
 
     send_message("반갑습니다! 질문해 주세요. ^^", "ai", save=False)
     paint_history()
@@ -191,18 +258,20 @@ if key:
     if message:
         send_message(message, "user")
 
+        if thread is None:
+            thread = client.beta.threads.create()
+            st.session_state["thread"] = thread
         client.beta.threads.messages.create(
             thread_id=thread.id, role="user", content=message
         )
         try:
-            with client.beta.threads.runs.stream(
-                thread_id=thread.id,
-                assistant_id=assistant.id,
-                event_handler=EventHandler(),
-                ) as stream:
-                with st.chat_message("ai"):
-                    with st.spinner("처리중..."):
-                        stream.until_done()
+            try:
+                stream_run(thread.id, assistant_id)
+            except NotFoundError:
+                # 캐시된 assistant가 삭제되었으면 캐시를 지우고 다시 찾거나 만들어서 한번 더 실행
+                forget_assistant(key_hash, ASSISTANT_NAME)
+                assistant_id = init_assistant(key_hash, ASSISTANT_NAME, assistant_config_hash())
+                stream_run(thread.id, assistant_id)
         except Exception as e:
             st.write(f"오류발생. {e}")
         
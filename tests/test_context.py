@@ -0,0 +1,55 @@
+from langchain.schema import Document
+import utils.context
+from utils.context import merge_chunks, sample_sections, select_passages
+
+
+def make_doc(text, start_index, source="doc.docx"):
+    return Document(page_content=text, metadata={"source": source, "start_index": start_index})
+
+
+# 페이지 원문에서 위치를 찾지 못한 청크(start_index=-1)는 서로 겹치는 것으로 보지 않고 모두 남겨야 함
+def test_merge_chunks_keeps_chunks_without_position():
+    first = "a" * 600
+    second = "b" * 600
+    merged = merge_chunks([make_doc(first, -1), make_doc(second, -1)])
+    assert merged == [first, second]
+
+
+def test_merge_chunks_dedupes_identical_chunks_without_position():
+    text = "a" * 600
+    assert merge_chunks([make_doc(text, -1), make_doc(text, -1)]) == [text]
+
+
+def test_merge_chunks_merges_overlapping_chunks():
+    page = "0123456789" * 10
+    merged = merge_chunks([make_doc(page[40:80], 40), make_doc(page[0:50], 0)])
+    assert merged == [page[0:80]]
+
+
+# 단어 하나를 토큰 하나로 세는 인코더. tiktoken 인코딩 파일을 내려받지 않고 테스트하기 위해 사용
+class WordEncoding:
+    def encode(self, text):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+# 첫 청크가 짧아도(ex. 표지) 구간 앞부분만이 아니라 구간 전체에서 고르게 골라야 함
+def test_sample_sections_spreads_across_section_with_short_first_chunk(monkeypatch):
+    monkeypatch.setattr(utils.context.tiktoken, "get_encoding", lambda name: WordEncoding())
+    docs = [Document(page_content="표지")] + [Document(page_content=f"chunk{i} " + "word " * 99) for i in range(1, 64)]
+    [section] = sample_sections(docs, 400, 1)
+    picked = [text.split()[0] for text in section.split("\n\n")]
+    assert picked[0] == "표지"
+    assert "chunk1" not in picked
+    assert picked[-1] in {f"chunk{i}" for i in range(32, 64)}
+
+
+# max_tokens가 passage_tokens보다 작아도 결과는 max_tokens를 넘지 않아야 함
+def test_select_passages_keeps_budget_below_passage_size(monkeypatch):
+    monkeypatch.setattr(utils.context.tiktoken, "get_encoding", lambda name: WordEncoding())
+    text = " ".join("rome" if i == 500 else f"word{i}" for i in range(1000))
+    selected = select_passages(text, 100, query="rome", passage_tokens=200)
+    assert len(selected.split()) <= 100
+    assert "rome" in selected.split()
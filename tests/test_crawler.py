@@ -0,0 +1,141 @@
+import threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from langchain.embeddings import FakeEmbeddings
+from langchain.text_splitter import CharacterTextSplitter
+from utils import vectorstore
+from utils.crawler import Crawler, RetryableStatus
+from utils.site import sync_site
+
+PAGES = ["/docs/a/", "/docs/b/", "/docs/c/"]
+
+
+# 합성 사이트맵과 페이지를 제공하는 로컬 HTTP 서버
+# - /docs/flaky/ 는 503, 429 후에 200, /docs/down/ 은 항상 500
+# - 페이지는 ETag를 주고, If-None-Match가 같으면 304로 응답
+# - server.lastmod가 있으면 사이트맵의 모든 페이지에 lastmod로 넣음
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, time.monotonic(), dict(self.headers)))
+            count = server.counts[self.path] = server.counts.get(self.path, 0) + 1
+
+        if self.path == "/sitemap.xml":
+            base = f"http://127.0.0.1:{server.server_port}"
+            lastmod = f"<lastmod>{server.lastmod}</lastmod>" if server.lastmod else ""
+            urls = "".join(f"<url><loc>{base}{path}</loc>{lastmod}</url>" for path in PAGES)
+            return self.respond(200, f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>')
+        if self.path == "/docs/flaky/" and count <= 2:
+            return self.respond(503 if count == 1 else 429, "")
+        if self.path == "/docs/down/":
+            return self.respond(500, "")
+
+        etag = f'"{self.path}-v1"'
+        if self.headers.get("If-None-Match") == etag:
+            return self.respond(304, None, {"ETag": etag})
+        return self.respond(200, f"{self.path} 본문입니다. " * 20, {"ETag": etag})
+
+    def respond(self, status, body, headers=None):
+        data = body.encode() if body else b""
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if body is not None:
+            self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.counts = {}
+    server.lastmod = None
+    server.base = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+def crawl(crawler, fetches):
+    return dict(crawler.iter_crawl(fetches))
+
+
+def test_crawler_limits_request_rate(server):
+    crawler = Crawler(rate=20.0, burst=1)
+    results = crawl(crawler, [(f"{server.base}/docs/{i}/", {}) for i in range(10)])
+    assert all(result[0] == 200 for result in results.values())
+    times = sorted(requested for _, requested, _ in server.requests)
+    # burst 1개 이후 나머지 9개는 초당 20개 속도로 요청
+    assert times[-1] - times[0] >= 9 / 20 * 0.9
+
+
+def test_crawler_retries_retryable_statuses(server):
+    crawler = Crawler(retries=2, backoff=0.01)
+    results = crawl(crawler, [(f"{server.base}/docs/flaky/", {}), (f"{server.base}/docs/down/", {})])
+    assert results[f"{server.base}/docs/flaky/"][0] == 200
+    assert server.counts["/docs/flaky/"] == 3
+    assert isinstance(results[f"{server.base}/docs/down/"], RetryableStatus)
+    assert server.counts["/docs/down/"] == 3
+
+
+def test_crawler_returns_not_modified_without_body(server):
+    url = f"{server.base}/docs/a/"
+    results = crawl(Crawler(), [(url, {"If-None-Match": '"/docs/a/-v1"'})])
+    status, text, headers = results[url]
+    assert (status, text, headers["ETag"]) == (304, None, '"/docs/a/-v1"')
+
+
+class CountingEmbeddings(FakeEmbeddings):
+    calls: int = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return super().embed_documents(texts)
+
+
+# 두번째 동기화는 ETag로 조건부 요청을 보내고, 304를 받은 페이지는 다시 임베딩하지 않음
+def test_sync_site_skips_unchanged_pages(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(vectorstore, "INDEX_FOLDER", str(tmp_path))
+    splitter = CharacterTextSplitter(separator=" ", chunk_size=100, chunk_overlap=0)
+    embeddings = CountingEmbeddings(size=8)
+
+    def sync():
+        return sync_site("test", f"{server.base}/sitemap.xml", None, splitter, embeddings, lambda html: html, Crawler())
+
+    first = sync()
+    assert embeddings.calls > 0
+    assert {doc.metadata["source"] for doc in first.docstore._dict.values()} == {server.base + path for path in PAGES}
+
+    embeddings.calls = 0
+    server.requests.clear()
+    second = sync()
+    page_requests = [headers for path, _, headers in server.requests if path in PAGES]
+    assert len(page_requests) == len(PAGES)
+    assert all(headers.get("If-None-Match") for headers in page_requests)
+    assert embeddings.calls == 0
+    assert len(second.docstore._dict) == len(first.docstore._dict)
+
+
+# 사이트맵의 lastmod만 바뀌고 내용은 그대로인 페이지는 다시 임베딩하지 않고 청크의 lastmod만 바꿈
+def test_sync_site_refreshes_lastmod_of_unchanged_pages(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(vectorstore, "INDEX_FOLDER", str(tmp_path))
+    splitter = CharacterTextSplitter(separator=" ", chunk_size=100, chunk_overlap=0)
+    embeddings = CountingEmbeddings(size=8)
+
+    def sync():
+        return sync_site("test", f"{server.base}/sitemap.xml", None, splitter, embeddings, lambda html: html, Crawler())
+
+    server.lastmod = "2024-01-01"
+    sync()
+    embeddings.calls = 0
+    server.lastmod = "2024-02-01"
+    second = sync()
+    assert embeddings.calls == 0
+    assert {doc.metadata["lastmod"] for doc in second.docstore._dict.values()} == {"2024-02-01"}
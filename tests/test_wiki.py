@@ -0,0 +1,107 @@
+import json, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pytest
+import utils.wiki as wiki
+from utils.cache import DiskCache
+
+TOP_K = 5
+TITLES = [f"Rome {i}" for i in range(TOP_K)]
+
+
+# 검색, revision 조회, 본문 조회에 응답하는 로컬 위키피디아 API 서버
+# - 본문 요청은 LATENCY 만큼 지연되고, 동시에 처리 중인 요청 수의 최대값을 max_in_flight에 기록
+# - 문서의 revision id는 server.revids에서 읽으므로 테스트 중에 바꿀 수 있음
+LATENCY = 0.2
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        if "list" in params:
+            kind = "search"
+            body = {"query": {"search": [{"title": title} for title in TITLES]}}
+        elif params.get("prop") == "revisions":
+            kind = "revisions"
+            titles = params["titles"].split("|")
+            body = {"query": {"pages": [{"title": title, "revisions": [{"revid": server.revids[title]}]} for title in titles]}}
+        else:
+            kind = "content"
+            title = params["titles"]
+            with server.lock:
+                server.in_flight += 1
+                server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            time.sleep(LATENCY)
+            with server.lock:
+                server.in_flight -= 1
+            body = {"query": {"pages": [{"title": title, "extract": f"{title} r{server.revids[title]} 본문입니다."}]}}
+        with server.lock:
+            server.requests.append((kind, params.get("titles")))
+
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.revids = {title: 1 for title in TITLES}
+    server.in_flight = 0
+    server.max_in_flight = 0
+    server.api_url = f"http://127.0.0.1:{server.server_port}/w/api.php"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path / "wikipedia.sqlite"), max_bytes=64 * 1024**2)
+    monkeypatch.setattr(wiki, "_cache", cache)
+    yield cache
+    cache.conn.close()
+
+
+def search(server):
+    return wiki.search_wikipedia("Rome", TOP_K, server.api_url)
+
+
+def test_search_wikipedia_fetches_pages_in_parallel(server, cache):
+    start = time.monotonic()
+    docs = search(server)
+    assert [doc.metadata["title"] for doc in docs] == TITLES
+    assert server.max_in_flight == TOP_K
+    # 순서대로 받아오면 TOP_K * LATENCY 이상 걸림
+    assert time.monotonic() - start < TOP_K * LATENCY
+
+
+def test_search_wikipedia_warm_call_makes_no_requests(server, cache):
+    first = search(server)
+    server.requests.clear()
+    second = search(server)
+    assert server.requests == []
+    assert [doc.page_content for doc in second] == [doc.page_content for doc in first]
+
+
+# revision 정보가 만료되면 revision id만 한번에 확인하고, revision이 바뀐 문서의 본문만 다시 받아옴
+def test_search_wikipedia_refetches_only_changed_revisions(server, cache, monkeypatch):
+    monkeypatch.setattr(wiki, "REVISION_TTL", 0.1)
+    search(server)
+    time.sleep(0.2)
+    server.revids["Rome 2"] = 2
+    server.requests.clear()
+
+    docs = search(server)
+    assert server.requests == [("revisions", "|".join(TITLES)), ("content", "Rome 2")]
+    assert docs[2].page_content == "Rome 2 r2 본문입니다."
+    assert docs[0].page_content == "Rome 0 r1 본문입니다."
@@ -0,0 +1,61 @@
+import hashlib, threading, time
+import requests
+
+# 검증 결과를 재사용하는 시간(초)
+VALIDATION_TTL = 600
+# OpenAI API 응답을 기다리는 최대 시간(초)
+VALIDATION_TIMEOUT = 5
+
+# 모든 페이지/세션이 커넥션을 재사용하도록 하나의 session을 공유
+_session = requests.Session()
+_lock = threading.Lock()
+# key 해시 -> (유효 여부, 만료 시각)
+_results = {}
+# key 해시 -> 검증이 끝나면 set 되는 Event
+_pending = {}
+
+
+def check_key(key):
+    response = _session.get(
+        "https://api.openai.com/v1/models",
+        headers={
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {key}",
+        },
+        timeout=VALIDATION_TIMEOUT,
+    )
+    return response.status_code
+
+
+# OPENAI_API_KEY 정합성 체크
+# streamlit은 화면을 조작할 때마다 스크립트를 다시 실행하므로, 결과를 key 해시 단위로 캐시해서
+# 매번 네트워크 요청이 발생하지 않도록 함. 같은 key를 동시에 검증하면 요청은 한번만 보냄
+def is_valid(key):
+    key_hash = hashlib.sha256(key.encode()).hexdigest()
+    with _lock:
+        cached = _results.get(key_hash)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        event = _pending.get(key_hash)
+        owner = event is None
+        if owner:
+            event = _pending[key_hash] = threading.Event()
+
+    if not owner:
+        event.wait(VALIDATION_TIMEOUT * 2)
+        cached = _results.get(key_hash)
+        return cached[0] if cached else False
+
+    try:
+        status_code = check_key(key)
+        # 200, 401 처럼 확실한 응답만 캐시하고, 일시적인 오류는 다음에 다시 확인
+        if status_code == 200 or status_code == 401:
+            with _lock:
+                _results[key_hash] = (status_code == 200, time.monotonic() + VALIDATION_TTL)
+        return status_code == 200
+    except:
+        return False
+    finally:
+        with _lock:
+            del _pending[key_hash]
+        event.set()
@@ -0,0 +1,134 @@
+import json, os, sqlite3, struct, threading, time
+import numpy as np
+from langchain.schema import BaseStore
+
+# 값 앞에 붙는 1바이트 태그로 저장 형식을 구분
+RAW, FLOAT32, FLOAT16, INT8 = 0, 1, 2, 3
+QUANTIZE_TAGS = {None: FLOAT32, "float16": FLOAT16, "int8": INT8}
+SQL_BATCH_SIZE = 500
+
+
+# CacheBackedEmbeddings는 임베딩을 JSON float 리스트로 직렬화해서 넘겨주므로,
+# 이를 float32/float16/int8 배열로 압축해서 저장
+def encode_value(value, quantize):
+    try:
+        vector = np.asarray(json.loads(value), dtype=np.float32)
+    except (ValueError, TypeError):
+        return bytes([RAW]) + value
+    if vector.ndim != 1:
+        return bytes([RAW]) + value
+
+    tag = QUANTIZE_TAGS[quantize]
+    if tag == FLOAT16:
+        return bytes([tag]) + vector.astype(np.float16).tobytes()
+    if tag == INT8:
+        # 벡터마다 최대 절대값 기준의 scale을 같이 저장
+        scale = float(np.abs(vector).max()) / 127 or 1.0
+        quantized = np.round(vector / scale).astype(np.int8)
+        return bytes([tag]) + struct.pack("<f", scale) + quantized.tobytes()
+    return bytes([tag]) + vector.tobytes()
+
+
+def decode_value(blob):
+    tag, body = blob[0], blob[1:]
+    if tag == RAW:
+        return bytes(body)
+    if tag == FLOAT16:
+        vector = np.frombuffer(body, dtype=np.float16)
+    elif tag == INT8:
+        (scale,) = struct.unpack("<f", body[:4])
+        vector = np.frombuffer(body[4:], dtype=np.int8).astype(np.float32) * scale
+    else:
+        vector = np.frombuffer(body, dtype=np.float32)
+    return json.dumps(vector.astype(np.float32).tolist()).encode()
+
+
+# LocalFileStore는 키마다 파일을 하나씩 만들어서 청크 수만큼 작은 파일이 생김
+# 모든 임베딩을 SQLite 파일 하나에 저장하고, 용량이 max_bytes를 넘으면 오래 사용하지 않은 것부터 삭제
+class SQLiteByteStore(BaseStore[str, bytes]):
+    def __init__(self, path, quantize=None, max_bytes=None):
+        if quantize not in QUANTIZE_TAGS:
+            raise ValueError(f"지원하지 않는 quantize 값입니다: {quantize}")
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.quantize = quantize
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS store (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed REAL NOT NULL
+                )
+                """
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS store_accessed ON store (accessed)")
+
+    def mget(self, keys):
+        now = time.time()
+        rows = {}
+        with self.lock, self.conn:
+            # SQLite의 바인딩 변수 개수 제한 때문에 나누어서 조회
+            for i in range(0, len(keys), SQL_BATCH_SIZE):
+                part = list(keys[i : i + SQL_BATCH_SIZE])
+                rows.update(
+                    self.conn.execute(
+                        f"SELECT key, value FROM store WHERE key IN ({','.join('?' * len(part))})",
+                        part,
+                    )
+                )
+            if self.max_bytes and rows:
+                self.conn.executemany(
+                    "UPDATE store SET accessed = ? WHERE key = ?",
+                    [(now, key) for key in rows],
+                )
+        return [decode_value(rows[key]) if key in rows else None for key in keys]
+
+    def mset(self, key_value_pairs):
+        now = time.time()
+        rows = []
+        for key, value in key_value_pairs:
+            blob = encode_value(value, self.quantize)
+            rows.append((key, blob, len(blob), now))
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO store VALUES (?, ?, ?, ?)", rows)
+            if self.max_bytes:
+                self.evict()
+
+    def mdelete(self, keys):
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM store WHERE key = ?", [(key,) for key in keys])
+
+    def yield_keys(self, prefix=None):
+        with self.lock:
+            if prefix is None:
+                keys = [row[0] for row in self.conn.execute("SELECT key FROM store")]
+            else:
+                keys = [
+                    row[0]
+                    for row in self.conn.execute(
+                        "SELECT key FROM store WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+                    )
+                ]
+        yield from keys
+
+    # 전체 용량이 max_bytes 이하가 될 때까지 가장 오래전에 사용한 항목부터 삭제
+    def evict(self):
+        (total,) = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM store").fetchone()
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        victims = []
+        for key, size in self.conn.execute("SELECT key, size FROM store ORDER BY accessed"):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self.conn.executemany("DELETE FROM store WHERE key = ?", victims)
@@ -0,0 +1,80 @@
+import json, os, sqlite3, threading, time
+
+
+# SQLite 파일 하나에 JSON으로 직렬화 가능한 값을 저장하는 캐시
+# 여러 프로세스/재시작 후에도 유지되며, ttl(초)이 지난 항목은 무시하고
+# 전체 용량이 max_bytes를 넘으면 가장 오래전에 사용한 항목부터 삭제
+# hits, misses에 이 프로세스에서의 get 적중/실패 횟수를 기록
+class DiskCache:
+    def __init__(self, path, ttl=None, max_bytes=None):
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires REAL,
+                    accessed REAL NOT NULL
+                )
+                """
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return default
+            value, expires = row
+            if expires is not None and expires < now:
+                self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self.misses += 1
+                return default
+            self.conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        ttl = ttl if ttl is not None else self.ttl
+        value = json.dumps(value, ensure_ascii=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now + ttl if ttl is not None else None, now),
+            )
+            if self.max_bytes:
+                self.evict(now)
+
+    def delete(self, key):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    # 만료된 항목을 먼저 지우고, 그래도 max_bytes를 넘으면 가장 오래전에 사용한 항목부터 삭제
+    def evict(self, now):
+        self.conn.execute("DELETE FROM cache WHERE expires < ?", (now,))
+        (total,) = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        victims = []
+        for key, size in self.conn.execute("SELECT key, size FROM cache ORDER BY accessed"):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self.conn.executemany("DELETE FROM cache WHERE key = ?", victims)
@@ -0,0 +1,129 @@
+import tiktoken
+
+# 청크 분할(utils.ingest)과 context 토큰 계산에 같은 tiktoken 인코더를 사용
+ENCODING_NAME = "cl100k_base"
+
+# 같은 문서에서 이 글자 수 이하로 떨어진 청크는 이어진 것으로 보고 합침
+ADJACENT_GAP = 2
+# sample_sections에서 구간의 평균 청크 크기를 추정할 때 토큰 수를 세어볼 청크 수
+SIZE_SAMPLE_CHUNKS = 16
+
+
+# 검색된 청크 중 같은 문서(source, page)에서 겹치거나 이어지는 청크를 하나로 합침
+# 청크는 chunk_overlap 만큼 앞뒤가 겹치므로, start_index를 이용해 겹치는 부분은 한번만 남김
+# rank는 합쳐진 청크 중 가장 관련도가 높은(검색 순서가 빠른) 값을 사용
+def merge_chunks(docs):
+    spans = {}
+    merged = []
+    seen = set()
+    for rank, doc in enumerate(docs):
+        text = doc.page_content
+        start = doc.metadata.get("start_index")
+        # langchain은 청크가 페이지 원문에 그대로 없으면(ex. 문단 경계를 넘는 DOCX/TXT 청크) start_index를 -1로 저장
+        # 이런 청크의 위치는 알 수 없으므로 start_index가 없는 청크와 같이 처리
+        if start is None or start < 0:
+            # 위치를 알 수 없는 청크는 완전히 같은 내용만 제거
+            if text not in seen:
+                seen.add(text)
+                merged.append({"rank": rank, "text": text})
+            continue
+        key = (doc.metadata.get("source"), doc.metadata.get("page"))
+        spans.setdefault(key, []).append(
+            {"rank": rank, "text": text, "start": start, "end": start + len(text)}
+        )
+
+    for chunks in spans.values():
+        chunks.sort(key=lambda chunk: chunk["start"])
+        current = chunks[0]
+        for chunk in chunks[1:]:
+            if chunk["start"] <= current["end"] + ADJACENT_GAP:
+                if chunk["end"] > current["end"]:
+                    if chunk["start"] > current["end"]:
+                        current["text"] += "\n" + chunk["text"]
+                    else:
+                        current["text"] += chunk["text"][current["end"] - chunk["start"]:]
+                    current["end"] = chunk["end"]
+                current["rank"] = min(current["rank"], chunk["rank"])
+            else:
+                merged.append(current)
+                current = chunk
+        merged.append(current)
+
+    merged.sort(key=lambda chunk: chunk["rank"])
+    return [chunk["text"] for chunk in merged]
+
+
+# 합친 청크를 관련도 순으로 max_tokens 까지만 채워서 context 문자열로 만듦
+# 마지막 청크가 예산을 넘으면 남은 토큰만큼 잘라서 넣음
+def pack_docs(docs, max_tokens, separator="\n\n"):
+    encoding = tiktoken.get_encoding(ENCODING_NAME)
+    separator_tokens = len(encoding.encode(separator))
+    packed = []
+    remaining = max_tokens
+    for text in merge_chunks(docs):
+        if packed:
+            remaining -= separator_tokens
+        tokens = encoding.encode(text)
+        if len(tokens) > remaining:
+            if remaining > 0:
+                packed.append(encoding.decode(tokens[:remaining]))
+            break
+        packed.append(text)
+        remaining -= len(tokens)
+    return separator.join(packed)
+
+
+# 문서 전체를 section_count 개의 연속된 구간으로 나누고, 각 구간에서 고르게 떨어진 청크를
+# 구간당 max_tokens / section_count 토큰까지 골라서 구간별 context 문자열을 만듦
+# 문서가 아무리 길어도 전체 context는 max_tokens를 넘지 않음
+def sample_sections(docs, max_tokens, section_count, separator="\n\n"):
+    encoding = tiktoken.get_encoding(ENCODING_NAME)
+    section_tokens = max_tokens // section_count
+    sections = []
+    for i in range(section_count):
+        part = docs[len(docs) * i // section_count : len(docs) * (i + 1) // section_count]
+        if not part:
+            continue
+        # 구간 전체에서 고르게 뽑은 청크의 평균 크기로 구간에 들어갈 청크 수를 추정해서 그 간격으로 고름
+        # (첫 청크만 보면 표지나 제목처럼 짧은 청크일 때 간격이 1이 되어 구간 앞부분에서만 고르게 됨)
+        sample = part[:: max(1, len(part) // SIZE_SAMPLE_CHUNKS)]
+        avg_tokens = max(1, sum(len(encoding.encode(doc.page_content)) for doc in sample) // len(sample))
+        step = max(1, len(part) * avg_tokens // section_tokens)
+        texts = []
+        remaining = section_tokens
+        for doc in part[::step]:
+            tokens = encoding.encode(doc.page_content)
+            if len(tokens) > remaining:
+                if not texts:
+                    texts.append(encoding.decode(tokens[:remaining]))
+                break
+            texts.append(doc.page_content)
+            remaining -= len(tokens)
+        sections.append(separator.join(texts))
+    return sections
+
+
+# 긴 본문을 max_tokens 이하로 줄임
+# query가 있으면 본문을 passage_tokens 크기의 구간으로 나누고, query의 단어가 많이 나오는
+# 구간만 골라서 원래 순서대로 이어붙임. query가 없으면 앞에서부터 max_tokens 까지만 사용
+def select_passages(text, max_tokens, query=None, passage_tokens=200, separator="\n...\n"):
+    encoding = tiktoken.get_encoding(ENCODING_NAME)
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    terms = set(query.lower().split()) if query else set()
+    if not terms:
+        return encoding.decode(tokens[:max_tokens])
+
+    # max_tokens가 passage_tokens보다 작아도 한 구간이 max_tokens를 넘지 않도록 구간 크기를 줄임
+    passage_tokens = min(passage_tokens, max_tokens)
+    passages = []
+    for start in range(0, len(tokens), passage_tokens):
+        passage = encoding.decode(tokens[start : start + passage_tokens])
+        lowered = passage.lower()
+        passages.append((sum(lowered.count(term) for term in terms), start, passage))
+    # 구분자까지 포함해서 max_tokens를 넘지 않도록 고를 구간 수를 정함
+    count = max(1, max_tokens // (passage_tokens + len(encoding.encode(separator))))
+    selected = sorted(passages, key=lambda passage: (-passage[0], passage[1]))[:count]
+    selected.sort(key=lambda passage: passage[1])
+    return separator.join(passage for _, _, passage in selected)
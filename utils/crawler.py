@@ -0,0 +1,104 @@
+import asyncio, queue, random, threading, time
+from urllib.parse import urlsplit
+import aiohttp
+
+# 이 상태 코드는 잠시 후 다시 요청하면 성공할 수 있으므로 재시도
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RetryableStatus(Exception):
+    pass
+
+
+# 호스트별 초당 요청 수를 제한하는 token bucket
+# burst 만큼은 연속으로 요청할 수 있고, 이후에는 rate 속도로 토큰이 채워짐
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# SitemapLoader는 페이지를 하나씩 순서대로 받아오므로, asyncio로 여러 페이지를 동시에 받아옴
+# - 하나의 커넥션 풀(keep-alive)을 모든 요청이 공유
+# - 호스트별 동시 요청 수(per_host)와 초당 요청 수(rate, burst)를 제한
+# - 연결 오류, timeout, 429/5xx 응답은 지수 backoff 후 재시도
+class Crawler:
+    def __init__(self, per_host=8, rate=10.0, burst=10, retries=3, backoff=0.5, timeout=20):
+        self.per_host = per_host
+        self.rate = rate
+        self.burst = burst
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+    async def fetch(self, session, url, headers):
+        host = urlsplit(url).netloc
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.per_host)
+            self.buckets[host] = TokenBucket(self.rate, self.burst)
+
+        async with self.semaphores[host]:
+            for attempt in range(self.retries + 1):
+                await self.buckets[host].acquire()
+                try:
+                    async with session.get(url, headers=headers) as response:
+                        if response.status in RETRY_STATUSES:
+                            raise RetryableStatus(f"{response.status} {url}")
+                        text = None if response.status == 304 else await response.text()
+                        # 서버가 Etag처럼 대소문자를 다르게 보내도 찾을 수 있도록 CIMultiDict 그대로 반환
+                        return response.status, text, response.headers.copy()
+                except (aiohttp.ClientError, asyncio.TimeoutError, RetryableStatus):
+                    if attempt == self.retries:
+                        raise
+                await asyncio.sleep(self.backoff * 2**attempt * random.uniform(0.5, 1.5))
+
+    # fetches의 (url, headers)를 모두 받아오면서, 끝나는 순서대로 on_result(url, 결과 혹은 예외)를 호출
+    async def crawl(self, fetches, on_result):
+        self.semaphores = {}
+        self.buckets = {}
+        connector = aiohttp.TCPConnector(limit=0, limit_per_host=self.per_host)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+
+            async def run(url, headers):
+                try:
+                    on_result(url, await self.fetch(session, url, headers))
+                except Exception as e:
+                    on_result(url, e)
+
+            await asyncio.gather(*[run(url, headers) for url, headers in fetches])
+
+    # streamlit 스크립트에서 바로 사용할 수 있도록, 별도 스레드의 event loop에서 크롤링하면서
+    # 받아온 페이지를 바로 넘겨주는 generator. 크롤링이 끝나기 전에 분할/임베딩을 시작할 수 있음
+    def iter_crawl(self, fetches):
+        results = queue.Queue()
+        done = object()
+        errors = []
+
+        def run():
+            try:
+                asyncio.run(self.crawl(fetches, lambda url, result: results.put((url, result))))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                results.put(done)
+
+        threading.Thread(target=run, daemon=True).start()
+        while (item := results.get()) is not done:
+            yield item
+        if errors:
+            raise errors[0]
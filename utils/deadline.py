@@ -0,0 +1,78 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import threading, time
+
+# 제한 시간이 지나 기다리지 않게 된 호출도 끝날 때까지 스레드를 차지하므로 넉넉하게 잡음
+ATTEMPT_WORKERS = 32
+
+_pool = ThreadPoolExecutor(max_workers=ATTEMPT_WORKERS, thread_name_prefix="attempt")
+
+
+# 요청(run) 하나에 주어진 전체 시간 예산. 각 호출은 남은 시간만큼만 사용
+class Deadline:
+    def __init__(self, seconds, clock=time.monotonic):
+        self.clock = clock
+        self.expires = clock() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires - self.clock())
+
+
+# 최근 window 개의 응답 시간으로 p95를 계산. 표본이 적을 때는 default를 사용
+class LatencyTracker:
+    def __init__(self, default, window=100, min_samples=20):
+        self.default = default
+        self.min_samples = min_samples
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def p95(self):
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return self.default
+            samples = sorted(self.samples)
+        return samples[int(0.95 * (len(samples) - 1))]
+
+
+# function을 별도 스레드에서 실행하고 timeout(초)이 지나면 기다리지 않고 TimeoutError를 발생
+# hedge_after가 주어지면 그 시간 안에 끝나지 않거나 실패했을 때 같은 호출을 한번 더 보내고,
+# 먼저 성공한 결과를 사용 (같은 요청을 다시 보내도 되는 검색 같은 호출에만 사용)
+# 기다리지 않게 된 호출 중 아직 시작하지 않은 호출은 취소
+def call_with_timeout(function, timeout, hedge_after=None, tracker=None):
+    if timeout <= 0:
+        raise TimeoutError("시간 예산을 모두 사용했습니다.")
+    start = time.monotonic()
+    deadline = start + timeout
+    pending = {_pool.submit(function)}
+    hedged = hedge_after is None
+    error = None
+    while True:
+        now = time.monotonic()
+        if now >= deadline:
+            break
+        if not hedged and (not pending or now >= start + hedge_after):
+            pending.add(_pool.submit(function))
+            hedged = True
+            continue
+        if not pending:
+            break
+        until = deadline if hedged else min(deadline, start + hedge_after)
+        done, pending = wait(pending, timeout=until - now, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if tracker:
+                    tracker.record(time.monotonic() - start)
+                for other in pending:
+                    other.cancel()
+                return future.result()
+            error = future.exception()
+
+    for future in pending:
+        future.cancel()
+    if error is not None and not pending:
+        raise error
+    raise TimeoutError(f"{timeout:.1f}초 안에 끝나지 않았습니다.")
@@ -0,0 +1,30 @@
+from bs4 import BeautifulSoup, SoupStrainer
+
+# 본문 영역이 없을 때 전체 문서에서 함께 제거할 영역
+FALLBACK_REMOVE_SELECTORS = ["script", "style", "noscript", "header", "nav", "footer"]
+
+
+# HTML에서 본문 텍스트를 추출
+# - SoupStrainer로 target 태그(ex. <main>) 하위만 파싱해서 전체 트리를 만들지 않음
+# - 메뉴, footer 같은 반복 영역은 remove_selectors(CSS 선택자)로 제거
+# - target 태그가 없는 페이지는 <body> 전체에서 공통 영역을 제거하고 추출
+class Extractor:
+    def __init__(self, target="main", remove_selectors=(), parser="lxml"):
+        self.target = target
+        self.remove_selectors = list(remove_selectors)
+        self.parser = parser
+
+    def __call__(self, html):
+        soup = BeautifulSoup(html, self.parser, parse_only=SoupStrainer(self.target))
+        root = soup.find(self.target)
+        selectors = self.remove_selectors
+        if root is None:
+            soup = BeautifulSoup(html, self.parser)
+            root = soup.body or soup
+            selectors = selectors + FALLBACK_REMOVE_SELECTORS
+
+        for selector in selectors:
+            for element in root.select(selector):
+                element.decompose()
+        # 줄바꿈, \xa0 등 연속된 공백은 하나의 공백으로 합침
+        return " ".join(root.get_text(" ").split())
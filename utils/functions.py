@@ -1,27 +1,135 @@
-from langchain.tools import WikipediaQueryRun, DuckDuckGoSearchRun
-from langchain.utilities import WikipediaAPIWrapper
-from langchain.document_loaders import WebBaseLoader
+import json, threading, time
+from urllib.parse import urlsplit, urlunsplit
+from langchain.tools import DuckDuckGoSearchRun
+import requests
+from requests.adapters import HTTPAdapter
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from utils.cache import DiskCache
+from utils.context import select_passages
+from utils.deadline import LatencyTracker, call_with_timeout
+from utils.extract import Extractor
+from utils.wiki import search_wikipedia
 
+# load_website가 받아올 최대 HTML 크기와, assistant에게 전달할 본문의 최대 토큰 수
+# 페이지가 아무리 커도 메모리 사용량과 submit_tool_outputs 크기가 일정하게 유지됨
+MAX_PAGE_BYTES = 2 * 1024**2
+PAGE_TOKENS = 3000
+FETCH_TIMEOUT = 15
+READ_CHUNK_SIZE = 64 * 1024
+HEADERS = {"User-Agent": "Mozilla/5.0 (compatible; ResearchGPT)"}
 
-def search_url_wikipedia(inputs):
-    query = inputs["query"]
-    wiki = WikipediaQueryRun(api_wrapper=WikipediaAPIWrapper())
-    return wiki.run(query)
+# search_url_wikipedia가 반환할 문서 수와 최대 글자 수 (WikipediaAPIWrapper 기본값과 동일)
+WIKIPEDIA_TOP_K = 3
+WIKIPEDIA_CHARS_MAX = 4000
 
+# 검색 결과와 페이지 본문을 디스크에 캐시해서 여러 사용자가 같은 주제를 조사하면 재사용
+SEARCH_TTL = 60 * 60 * 6
+PAGE_TTL = 60 * 60 * 24
 
-def search_url_duckduckgo(inputs):
-    query = inputs["query"]
-    ddg = DuckDuckGoSearchRun()
-    return ddg.run(query)
+# 같은 요청을 다시 보내도 되는 검색 도구는 캐시에 없어서 원본에 요청할 때, p95 응답 시간 안에
+# 끝나지 않으면 한번 더 요청(hedge). 응답 시간 표본이 충분히 쌓이기 전에는 HEDGE_AFTER(초)를 사용하고,
+# 표본이 빠른 응답에 치우쳐도 hedge가 바로 나가서 요청이 두배가 되지 않도록 MIN_HEDGE_AFTER(초) 이상 기다림
+HEDGED_TOOLS = ["search_url_wikipedia", "search_url_duckduckgo"]
+HEDGE_AFTER = 3.0
+MIN_HEDGE_AFTER = 1.0
 
+extract_page = Extractor(target="main")
 
+# 모든 세션의 도구 호출이 커넥션을 재사용하도록 프로세스 전체에서 하나의 session과 검색 도구를 공유
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+_session.mount("http://", _adapter)
+_session.mount("https://", _adapter)
+_ddg = DuckDuckGoSearchRun()
+tool_cache = DiskCache("./.cache/research.sqlite", max_bytes=256 * 1024**2)
+latencies = {name: LatencyTracker(default=HEDGE_AFTER) for name in HEDGED_TOOLS}
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+# scheme, host는 소문자로 바꾸고 #fragment는 제거해서 같은 페이지는 같은 키를 사용
+def normalize_url(url):
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", parts.query, ""))
+
+
+# 캐시에 있으면 그대로 반환하고, 없으면 load()의 결과를 ttl 동안 저장
+# timeout이 주어지면 원본 요청(load)에만 timeout과 hedge를 적용하고, 원본 요청의 응답 시간만 tracker에 기록
+def cached(key, ttl, load, timeout=None, tracker=None):
+    value = tool_cache.get(key)
+    if value is None:
+        if timeout is None:
+            value = load()
+        else:
+            hedge_after = max(MIN_HEDGE_AFTER, tracker.p95()) if tracker else None
+            value = call_with_timeout(load, timeout, hedge_after=hedge_after, tracker=tracker)
+        tool_cache.set(key, value, ttl=ttl)
+    return value
+
+
+# WikipediaQueryRun과 같은 형식으로 반환하고, assistant가 링크를 찾을 수 있도록 URL을 함께 제공
+# 문서마다 WIKIPEDIA_CHARS_MAX를 나누어 쓰므로, 모든 문서의 제목과 URL이 잘리지 않고 전달됨
+def wikipedia_summaries(query):
+    docs = search_wikipedia(query, top_k=WIKIPEDIA_TOP_K)
+    if not docs:
+        return "No good Wikipedia Search Result was found"
+    separator = "\n\n"
+    page_chars = (WIKIPEDIA_CHARS_MAX - len(separator) * (len(docs) - 1)) // len(docs)
+    summaries = []
+    for doc in docs:
+        header = f"Page: {doc.metadata['title']}\nURL: {doc.metadata['source']}\nSummary: "
+        summaries.append(header + doc.page_content[: max(0, page_chars - len(header))])
+    return separator.join(summaries)
+
+
+def search_url_wikipedia(inputs, timeout=None):
+    query = normalize_query(inputs["query"])
+    return cached(
+        f"wikipedia:{query}",
+        SEARCH_TTL,
+        lambda: wikipedia_summaries(query),
+        timeout,
+        latencies["search_url_wikipedia"],
+    )
+
+
+def search_url_duckduckgo(inputs, timeout=None):
+    query = normalize_query(inputs["query"])
+    return cached(
+        f"duckduckgo:{query}",
+        SEARCH_TTL,
+        lambda: _ddg.run(query),
+        timeout,
+        latencies["search_url_duckduckgo"],
+    )
+
+
+# 응답을 조금씩 읽다가 MAX_PAGE_BYTES에 도달하거나 FETCH_TIMEOUT이 지나면 나머지는 받지 않음
+# (requests의 timeout은 소켓 작업 하나당 시간이므로 전체 시간은 직접 확인)
+def fetch_html(url):
+    expires = time.monotonic() + FETCH_TIMEOUT
+    with _session.get(url, headers=HEADERS, stream=True, timeout=FETCH_TIMEOUT) as response:
+        response.raise_for_status()
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(READ_CHUNK_SIZE):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= MAX_PAGE_BYTES or time.monotonic() > expires:
+                break
+    return b"".join(chunks)[:MAX_PAGE_BYTES]
+
+
+# 페이지 전체 대신 본문만 추출해서 PAGE_TOKENS 이하로 줄여서 반환
+# query가 주어지면 query와 관련된 부분을 우선해서 남김
+# 추출한 본문을 URL 단위로 캐시하고, 질의에 맞는 부분은 호출할 때마다 다시 고름
 def load_website(inputs):
-    url = inputs["url"]
-    wl = WebBaseLoader([url])
-    docs = wl.load()
-    text = "\n\n".join([doc.page_content for doc in docs])
-    return text
+    url = normalize_url(inputs["url"])
+    text = cached(f"page:{url}", PAGE_TTL, lambda: extract_page(fetch_html(url)))
+    return select_passages(text, PAGE_TOKENS, query=inputs.get("query"))
 
 
 def save_file(inputs):
@@ -40,6 +148,30 @@ functions_map = {
 }
 
 
+# assistant가 요청한 도구를 timeout(초) 안에 실행하고 결과 문자열을 반환
+# 시간이 초과되거나 실패해도 예외 대신 assistant에게 전달할 문자열을 반환해서 run이 계속 진행되도록 함
+def run_tool(name, arguments, timeout):
+    if name not in functions_map:
+        return f"오류: {name} 함수가 없습니다."
+    function = functions_map[name]
+    # save_file처럼 streamlit 요소를 그리는 도구가 있으므로 호출한 스레드의 script context를 연결
+    ctx = get_script_run_ctx()
+
+    def attempt():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return function(json.loads(arguments))
+
+    try:
+        # 검색 도구는 캐시를 먼저 확인하고, 캐시에 없을 때만 timeout과 hedge를 적용해서 원본에 요청
+        if name in HEDGED_TOOLS:
+            return function(json.loads(arguments), timeout)
+        return call_with_timeout(attempt, timeout)
+    except TimeoutError:
+        return f"{name}: 제한 시간 안에 결과를 가져오지 못했습니다 (no result). 이미 찾은 정보로 답변하세요."
+    except Exception as e:
+        return f"오류: {name} 실행 중 오류가 발생했습니다. ({e})"
+
+
 functions = [
     {
         "type": "function",
@@ -94,6 +226,10 @@ functions = [
                         "type": "string",
                         "description": "Wikipedia 와 DuckDuckGo에서 찾은 URL 입니다.",
                     },
+                    "query": {
+                        "type": "string",
+                        "description": "사용자의 질의입니다. 긴 문서에서는 질의와 관련된 부분을 우선해서 가져옵니다.",
+                    },
                 },
                 "required": ["url"],
             },
@@ -0,0 +1,255 @@
+import hashlib, os, tempfile, threading, multiprocessing
+import openai
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from langchain.document_loaders import PyPDFLoader, UnstructuredFileLoader
+from langchain.schema import Document
+from langchain.schema.runnable import RunnableLambda
+from langchain.text_splitter import CharacterTextSplitter
+from langchain.vectorstores.faiss import FAISS
+from pypdf import PdfReader
+import streamlit as st
+from utils.context import ENCODING_NAME
+from utils.vectorstore import load_index, save_index
+
+FILE_FOLDER = "./.cache/files"
+# 업로드 파일을 한번에 메모리에 올리지 않고 1MB씩 나누어 처리
+READ_CHUNK_SIZE = 1024 * 1024
+# 여러 파일을 병렬로 파싱할 때 PDF는 이 페이지 수만큼씩 나누어 프로세스 풀에 넘김
+PDF_PAGES_PER_TASK = 16
+# 프로세스 풀에 한번에 넘겨둘 작업 수. 임베딩이 파싱보다 느려도 파싱 결과가 메모리에 쌓이지 않도록 제한
+MAX_PENDING_TASKS = 2 * (os.cpu_count() or 1)
+
+
+# 업로드된 파일을 청크 단위로 디스크에 쓰면서 동시에 SHA-256을 계산
+# 파일명 대신 내용의 해시로 저장하므로, 같은 문서는 이름이 달라도 한번만 파싱/임베딩되고
+# 이름만 같은 서로 다른 문서(ex. report.pdf)는 더이상 충돌하지 않음
+def save_upload(file):
+    # .cache 폴더가 없으면 생성해준다.
+    if not os.path.exists(FILE_FOLDER):
+        os.makedirs(FILE_FOLDER)
+
+    # UnstructuredFileLoader가 확장자로 파일 형식을 판단하므로 확장자는 유지
+    ext = os.path.splitext(file.name)[1].lower()
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=FILE_FOLDER, suffix=".part")
+    try:
+        file.seek(0)
+        with os.fdopen(fd, "wb") as f:
+            for chunk in iter(lambda: file.read(READ_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                f.write(chunk)
+        file_hash = digest.hexdigest()
+        file_path = f"{FILE_FOLDER}/{file_hash}{ext}"
+        # 이미 같은 내용의 파일이 있으면 임시 파일만 지움
+        if os.path.exists(file_path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, file_path)
+    except:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return file_hash, file_path
+
+
+# rerun 마다 같은 업로드 파일을 다시 쓰고 해시하지 않도록 session_state에 결과를 보관
+def get_upload(file):
+    uploads = st.session_state.setdefault("uploads", {})
+    if file.file_id not in uploads:
+        uploads[file.file_id] = save_upload(file)
+    return uploads[file.file_id]
+
+
+# 문서를 페이지 단위로 하나씩 읽어옴
+# PDF는 pypdf로 한 페이지씩 읽고, 그 외 형식은 UnstructuredFileLoader로 읽음
+def iter_pages(file_path):
+    if file_path.endswith(".pdf"):
+        yield from PyPDFLoader(file_path).lazy_load()
+    else:
+        yield from UnstructuredFileLoader(file_path).load()
+
+
+# 페이지를 읽는 즉시 분할해서 청크를 하나씩 넘겨줌
+def iter_chunks(file_path, splitter):
+    for page in iter_pages(file_path):
+        yield from splitter.split_documents([page])
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# 파싱 프로세스 풀. CPU 코어 수만큼만 동시에 파싱하도록 제한
+# streamlit 서버는 여러 스레드가 동작 중이므로 fork 대신 spawn으로 프로세스를 생성
+_pool = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=os.cpu_count(),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+# 작업 프로세스가 죽으면(ex. 큰 PDF 파싱 중 OOM) 풀은 다시 사용할 수 없으므로 버리고 다음 get_pool()에서 새로 생성
+# 다른 작업이 이미 새 풀을 만들었으면 그대로 둠
+def reset_pool(pool):
+    global _pool
+    if _pool is pool:
+        _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+# tiktoken 기반 splitter는 pickle이 안되므로, 프로세스 안에서 직접 생성
+# start_index는 검색된 청크끼리 겹치는 부분을 합칠 때 사용 (utils.context 참고)
+def make_splitter(chunk_size=600, chunk_overlap=100):
+    return CharacterTextSplitter.from_tiktoken_encoder(
+        encoding_name=ENCODING_NAME,
+        separator="\n",
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        add_start_index=True,
+    )
+
+
+# 프로세스 풀에서 실행되는 파싱/분할 작업
+# PDF는 [start, stop) 범위의 페이지만 읽고, 그 외 형식은 파일 전체를 읽음
+# (UnstructuredFileLoader는 파일 전체를 한번에 파싱하므로 나눌 수 없음)
+def split_in_process(file_path, chunk_size, chunk_overlap, start=None, stop=None):
+    splitter = make_splitter(chunk_size, chunk_overlap)
+    if start is None:
+        return list(iter_chunks(file_path, splitter))
+    reader = PdfReader(file_path)
+    docs = []
+    for page_number in range(start, stop):
+        # PyPDFLoader와 같은 형식의 페이지 Document
+        page = Document(
+            page_content=reader.pages[page_number].extract_text(),
+            metadata={"source": file_path, "page": page_number},
+        )
+        docs.extend(splitter.split_documents([page]))
+    return docs
+
+
+# 파일 하나는 백그라운드 스레드에서 페이지 단위로 바로 분할하고 (프로세스 풀을 띄우지 않음)
+# 여러 파일은 PDF를 페이지 범위 단위로 나누어 프로세스 풀에서 병렬로 파싱/분할
+# 어느 쪽이든 분할된 청크는 조금씩 배치 임베딩 -> 인덱스 추가를 거쳐 하나의 인덱스로 합쳐지므로
+# 앞쪽 청크가 인덱싱되면 나머지를 기다리지 않고 바로 질문할 수 있고, PDF는 파일이 커져도 메모리 사용량이 늘지 않음
+class IngestJob:
+    def __init__(self, name, file_paths, embeddings, chunk_size=600, chunk_overlap=100, batch_size=64):
+        self.name = name
+        self.file_paths = file_paths
+        self.embeddings = embeddings
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.vectorstore = load_index(name, embeddings)
+        self.count = 0
+        self.error = None
+        self.done = self.vectorstore is not None
+
+        if not self.done:
+            threading.Thread(target=self.run, daemon=True).start()
+
+    # API key, rate limit, 네트워크 오류, 파싱 프로세스 종료처럼 다시 시도하면 성공할 수 있는 실패인지 여부
+    # 텍스트가 없는 문서 등 파싱 오류는 다시 실행해도 같은 결과이므로 제외
+    def is_retryable(self):
+        return isinstance(self.error, (openai.APIError, BrokenProcessPool))
+
+    # 실패한 작업을 처음부터 다시 실행. 여러 세션이 동시에 호출해도 한번만 다시 시작
+    # 실패 원인이 API key일 수 있으므로 호출한 세션의 embeddings로 교체
+    def retry(self, embeddings):
+        with self.lock:
+            if not self.done or not self.is_retryable():
+                return
+            self.embeddings = embeddings
+            self.vectorstore = None
+            self.count = 0
+            self.error = None
+            self.done = False
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        try:
+            if len(self.file_paths) == 1:
+                chunks = iter_chunks(self.file_paths[0], make_splitter(self.chunk_size, self.chunk_overlap))
+            else:
+                chunks = (chunk for docs in self.iter_parallel() for chunk in docs)
+            for batch in batched(chunks, self.batch_size):
+                self.add(batch)
+            if self.vectorstore is None:
+                raise ValueError("문서에서 텍스트를 찾을 수 없습니다.")
+            with self.lock:
+                save_index(self.name, self.vectorstore)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+
+    # 프로세스 풀에 넘길 작업 목록. PDF는 PDF_PAGES_PER_TASK 페이지씩 나눔
+    def tasks(self):
+        for file_path in self.file_paths:
+            if file_path.endswith(".pdf"):
+                page_count = len(PdfReader(file_path).pages)
+                for start in range(0, page_count, PDF_PAGES_PER_TASK):
+                    stop = min(start + PDF_PAGES_PER_TASK, page_count)
+                    yield (file_path, self.chunk_size, self.chunk_overlap, start, stop)
+            else:
+                yield (file_path, self.chunk_size, self.chunk_overlap)
+
+    # 작업을 MAX_PENDING_TASKS 개까지만 풀에 넘겨두고, 끝난 작업의 청크부터 넘겨줌
+    def iter_parallel(self):
+        pool = get_pool()
+        tasks = self.tasks()
+        pending = set()
+        try:
+            while True:
+                for task in tasks:
+                    pending.add(pool.submit(split_in_process, *task))
+                    if len(pending) >= MAX_PENDING_TASKS:
+                        break
+                if not pending:
+                    return
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        except BrokenProcessPool:
+            reset_pool(pool)
+            raise
+
+    def add(self, batch):
+        # 임베딩 API 호출은 lock 밖에서 수행해서 검색을 막지 않도록 함
+        texts = [doc.page_content for doc in batch]
+        metadatas = [doc.metadata for doc in batch]
+        text_embeddings = list(zip(texts, self.embeddings.embed_documents(texts)))
+        with self.lock:
+            if self.vectorstore is None:
+                self.vectorstore = FAISS.from_embeddings(text_embeddings, self.embeddings, metadatas)
+            else:
+                self.vectorstore.add_embeddings(text_embeddings, metadatas)
+            self.count += len(batch)
+
+    # 전체 인덱싱이 끝났거나, 질문을 받을 수 있을만큼 청크가 쌓였는지 여부
+    def is_ready(self, min_chunks):
+        return self.done or self.count >= min_chunks
+
+    # 인덱스는 여러 세션이 공유하므로, 질문 임베딩은 질문한 세션의 key(query_embeddings)로 계산
+    def search(self, query, query_embeddings):
+        embedding = query_embeddings.embed_query(query)
+        with self.lock:
+            return self.vectorstore.similarity_search_by_vector(embedding)
+
+    def as_retriever(self, query_embeddings):
+        return RunnableLambda(lambda query: self.search(query, query_embeddings))
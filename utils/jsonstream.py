@@ -0,0 +1,50 @@
+import json
+
+
+# 스트리밍으로 조금씩 들어오는 JSON 문자열에서, 최상위 객체의 field 배열에 들어있는 객체를
+# 완성되는 즉시 하나씩 꺼내주는 파서
+# ex) '{"questions": [{"question": ...}, {"que' 까지 들어오면 첫번째 question 객체만 반환
+class ArrayItemParser:
+    def __init__(self, field):
+        self.field = field
+        self.buffer = ""
+        self.position = 0
+        self.array_start = None
+        self.item_start = None
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text):
+        self.buffer += text
+        if self.array_start is None:
+            # "field": [ 가 나올 때까지 기다림
+            key = self.buffer.find(f'"{self.field}"')
+            start = self.buffer.find("[", key) if key >= 0 else -1
+            if start < 0:
+                return []
+            self.array_start = start
+            self.position = start + 1
+
+        items = []
+        for i in range(self.position, len(self.buffer)):
+            char = self.buffer[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                if self.depth == 0 and char == "{":
+                    self.item_start = i
+                self.depth += 1
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 0 and char == "}":
+                    items.append(json.loads(self.buffer[self.item_start : i + 1]))
+        self.position = len(self.buffer)
+        return items
@@ -0,0 +1,112 @@
+import hashlib
+from langchain.schema import Document
+from langchain.vectorstores.faiss import FAISS
+from utils.crawler import Crawler
+from utils.sitemap import iter_sitemap
+from utils.vectorstore import load_index, load_manifest, save_index
+
+# 받아온 페이지의 청크를 이만큼 모아서 한번에 임베딩/인덱스 추가
+EMBED_BATCH_SIZE = 64
+
+
+# 이전에 받은 ETag / Last-Modified 를 이용한 조건부 GET 헤더
+def conditional_headers(record):
+    headers = {}
+    if record.get("etag"):
+        headers["If-None-Match"] = record["etag"]
+    if record.get("last_modified"):
+        headers["If-Modified-Since"] = record["last_modified"]
+    return headers
+
+
+def add_chunks(vector_store, embeddings, docs, ids):
+    if vector_store is None:
+        return FAISS.from_documents(docs, embeddings, ids=ids)
+    vector_store.add_documents(docs, ids=ids)
+    return vector_store
+
+
+# 내용이 바뀌지 않아 다시 임베딩하지 않은 페이지도, 청크의 lastmod는 사이트맵의 최신 값으로 바꿔줌
+# lastmod는 map 단계 대답 캐시의 키와 최종 대답의 날짜로 사용되므로 manifest와 같아야 함
+def refresh_lastmod(vector_store, ids, lastmod):
+    for id in ids:
+        doc = vector_store.docstore.search(id)
+        if isinstance(doc, Document):
+            doc.metadata["lastmod"] = lastmod
+
+
+# 사이트맵과 manifest(URL -> lastmod/ETag/내용 해시/청크 id)를 비교해서
+# 새로 생기거나 바뀐 페이지만 받아오고, 인덱스에서 해당 URL의 청크만 지우고 다시 추가
+# 저장된 인덱스가 없으면 모든 페이지를 받아서 새로 만듦
+# extract는 HTML에서 본문 텍스트를 뽑는 함수(utils.extract.Extractor)
+# 페이지는 Crawler가 동시에 받아오고, 받아온 페이지부터 분할/임베딩해서 EMBED_BATCH_SIZE 단위로 인덱스에 추가
+def sync_site(name, url, filter_urls, splitter, embeddings, extract, crawler=None):
+    crawler = crawler or Crawler()
+    vector_store = load_index(name, embeddings)
+    manifest = load_manifest(name) if vector_store is not None else {}
+    pages = manifest.get("pages", {})
+    entries = {entry["loc"]: entry for entry in iter_sitemap(url, filter_urls)}
+
+    stale_ids = []
+    batch_docs = []
+    batch_ids = []
+
+    # 사이트맵에서 사라진 페이지의 청크는 삭제
+    for loc in list(pages):
+        if loc not in entries:
+            stale_ids += pages.pop(loc)["ids"]
+
+    fetches = [
+        (loc, conditional_headers(pages.get(loc, {})))
+        for loc, entry in entries.items()
+        if not (loc in pages and entry["lastmod"] and pages[loc].get("lastmod") == entry["lastmod"])
+    ]
+    for loc, result in crawler.iter_crawl(fetches):
+        # 받아오지 못한 페이지는 기존 청크를 그대로 두고 다음 동기화 때 다시 시도
+        if isinstance(result, Exception):
+            continue
+        status, html, headers = result
+        if status != 304 and status >= 400:
+            continue
+
+        record = pages.get(loc, {})
+        record = {
+            **record,
+            "lastmod": entries[loc]["lastmod"],
+            "etag": headers.get("ETag", record.get("etag")),
+            "last_modified": headers.get("Last-Modified", record.get("last_modified")),
+        }
+        pages[loc] = record
+        if html is None:
+            refresh_lastmod(vector_store, record.get("ids", []), record["lastmod"])
+            continue
+        text = extract(html)
+        content_hash = hashlib.sha256(text.encode()).hexdigest()
+        if record.get("hash") == content_hash:
+            refresh_lastmod(vector_store, record.get("ids", []), record["lastmod"])
+            continue
+
+        docs = splitter.split_documents(
+            [Document(page_content=text, metadata={"source": loc, "lastmod": entries[loc]["lastmod"]})]
+        )
+        ids = [f"{loc}#{content_hash[:12]}-{i}" for i in range(len(docs))]
+        stale_ids += record.get("ids", [])
+        record["hash"] = content_hash
+        record["ids"] = ids
+        batch_docs += docs
+        batch_ids += ids
+        if len(batch_docs) >= EMBED_BATCH_SIZE:
+            vector_store = add_chunks(vector_store, embeddings, batch_docs, batch_ids)
+            batch_docs = []
+            batch_ids = []
+
+    if batch_docs:
+        vector_store = add_chunks(vector_store, embeddings, batch_docs, batch_ids)
+    # 청크 id에 내용 해시가 들어있으므로, 새 청크를 추가한 뒤에 이전 청크를 지워도 충돌하지 않음
+    if vector_store is not None and stale_ids:
+        vector_store.delete(stale_ids)
+    if vector_store is None:
+        raise ValueError("사이트맵에서 가져올 수 있는 문서가 없습니다.")
+
+    save_index(name, vector_store, {"pages": pages})
+    return vector_store
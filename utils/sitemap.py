@@ -0,0 +1,63 @@
+import gzip
+import xml.etree.ElementTree as ET
+import requests
+
+# 사이트맵 요청을 기다리는 최대 시간(초)
+FETCH_TIMEOUT = 20
+
+_session = requests.Session()
+
+
+def local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+# 사이트맵 응답을 내려받는 대로 읽을 수 있는 file 객체로 반환
+# Content-Encoding: gzip 은 urllib3가 풀어주고, .xml.gz 처럼 파일 자체가 gzip이면 GzipFile로 풀어줌
+def open_sitemap(url):
+    response = _session.get(url, stream=True, timeout=FETCH_TIMEOUT)
+    response.raise_for_status()
+    response.raw.decode_content = True
+    content_type = response.headers.get("Content-Type", "")
+    if url.endswith(".gz") or "gzip" in content_type:
+        return gzip.GzipFile(fileobj=response.raw)
+    return response.raw
+
+
+# 사이트맵 XML을 iterparse로 조금씩 읽으면서 <url> 항목을 하나씩 반환
+# 처리한 항목은 바로 지워서 전체 트리를 메모리에 올리지 않고, filter_urls로 시작하지 않는 URL은 바로 버림
+# <sitemapindex>의 하위 사이트맵 주소는 nested에 모아둠
+def parse_sitemap(stream, filter_urls=None, nested=None):
+    root = None
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        if root is None:
+            root = elem
+        if event != "end":
+            continue
+        tag = local_name(elem.tag)
+        if tag not in ("url", "sitemap"):
+            continue
+
+        fields = {local_name(child.tag): (child.text or "").strip() for child in elem}
+        root.clear()
+        loc = fields.get("loc")
+        if not loc:
+            continue
+        if tag == "sitemap":
+            if nested is not None:
+                nested.append(loc)
+        elif filter_urls is None or any(loc.startswith(prefix) for prefix in filter_urls):
+            yield {"loc": loc, "lastmod": fields.get("lastmod") or None}
+
+
+# 사이트맵 주소에서 <url> 항목을 {"loc", "lastmod"} 형태로 하나씩 반환
+# 사이트맵 인덱스면 하위 사이트맵도 차례로 읽음
+def iter_sitemap(url, filter_urls=None):
+    nested = []
+    stream = open_sitemap(url)
+    try:
+        yield from parse_sitemap(stream, filter_urls, nested)
+    finally:
+        stream.close()
+    for sitemap_url in nested:
+        yield from iter_sitemap(sitemap_url, filter_urls)
@@ -0,0 +1,43 @@
+import time
+import streamlit as st
+
+
+# 토큰이 들어올 때마다 전체 메시지를 markdown으로 다시 그리면 답변 길이의 제곱에 비례하는
+# 렌더링 비용과 토큰 수만큼의 websocket 메시지가 발생함
+# 토큰을 모아두었다가 fps 주기 혹은 flush_chars 글자가 쌓였을 때만 화면에 반영
+class StreamRenderer:
+    def __init__(self, fps=10, flush_chars=400, clock=time.monotonic):
+        self.interval = 1 / fps
+        self.flush_chars = flush_chars
+        self.clock = clock
+        self.text = ""
+        self.box = None
+        self.pending = 0
+        self.flushed_at = 0.0
+
+    def start(self, box=None):
+        self.box = box if box is not None else st.empty()
+        self.flushed_at = self.clock()
+
+    # 토큰 단위로 받는 경우 (langchain callback)
+    def write(self, token):
+        self.text += token
+        self.pending += len(token)
+        self.maybe_flush()
+
+    # 지금까지의 전체 텍스트를 받는 경우 (OpenAI assistant 의 snapshot)
+    def update(self, text):
+        self.pending += len(text) - len(self.text)
+        self.text = text
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        if self.pending >= self.flush_chars or self.clock() - self.flushed_at >= self.interval:
+            self.flush()
+
+    # 답변이 끝나면 반드시 호출해서 남은 토큰을 그려줌
+    def flush(self):
+        if self.box is not None and self.pending:
+            self.box.markdown(self.text)
+        self.pending = 0
+        self.flushed_at = self.clock()
@@ -0,0 +1,83 @@
+import json, os, pickle, shutil, tempfile, time, uuid
+import faiss
+from langchain.vectorstores.faiss import FAISS
+
+INDEX_FOLDER = "./.cache/indexes"
+# 청크 크기, 임베딩 모델 등 인덱스 내용이 바뀌는 변경을 하면 버전을 올려서 이전 인덱스를 무시
+INDEX_VERSION = "v5"
+# 인덱스 폴더 안에서 현재 사용 중인 스냅샷 이름을 가리키는 파일
+CURRENT_FILE = "CURRENT"
+# 저장할 때 현재 스냅샷 외에 남겨둘 이전 스냅샷 수 (아직 이전 스냅샷을 읽고 있는 프로세스를 위해)
+KEEP_SNAPSHOTS = 2
+
+
+def index_path(name):
+    return f"{INDEX_FOLDER}/{INDEX_VERSION}/{name}"
+
+
+# CURRENT 파일이 가리키는 스냅샷 폴더. 저장된 인덱스가 없으면 None
+def current_snapshot(name):
+    folder = index_path(name)
+    try:
+        with open(f"{folder}/{CURRENT_FILE}", encoding="utf-8") as f:
+            snapshot = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return f"{folder}/{snapshot}"
+
+
+# 디스크에 저장된 FAISS 인덱스와 docstore를 불러옴. 없으면 None
+# langchain이 만드는 IndexFlatL2는 mmap으로 읽을 수 없으므로 인덱스와 docstore 모두 메모리에 올림
+def load_index(name, embeddings):
+    snapshot = current_snapshot(name)
+    if snapshot is None:
+        return None
+
+    index = faiss.read_index(f"{snapshot}/index.faiss")
+    with open(f"{snapshot}/index.pkl", "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+# 인덱스를 매번 새 스냅샷 폴더에 저장한 뒤 CURRENT 파일을 os.replace로 교체
+# 읽는 쪽은 항상 완성된 스냅샷 하나를 보게 되고, 여러 프로세스가 동시에 저장해도
+# 서로 다른 폴더에 쓰므로 충돌하지 않음 (마지막에 CURRENT를 바꾼 스냅샷이 사용됨)
+# manifest는 인덱스에 들어있는 내용에 대한 부가 정보(ex. 크롤링한 URL 목록)로, 인덱스와 같은 폴더에 함께 저장
+def save_index(name, vectorstore, manifest=None):
+    folder = index_path(name)
+    if not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+
+    tmp_folder = tempfile.mkdtemp(dir=folder, prefix=".tmp-")
+    vectorstore.save_local(tmp_folder)
+    if manifest is not None:
+        with open(f"{tmp_folder}/manifest.json", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+    # 이름순 정렬이 저장 순서가 되도록 시간을 앞에 붙임
+    snapshot = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+    os.replace(tmp_folder, f"{folder}/{snapshot}")
+
+    fd, tmp_current = tempfile.mkstemp(dir=folder, prefix=".tmp-")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(snapshot)
+    os.replace(tmp_current, f"{folder}/{CURRENT_FILE}")
+    remove_old_snapshots(folder, snapshot)
+
+
+# 저장 중인 임시 폴더(.tmp-)와 최근 스냅샷은 남기고 나머지 이전 스냅샷을 삭제
+def remove_old_snapshots(folder, current):
+    snapshots = sorted(
+        entry
+        for entry in os.listdir(folder)
+        if entry != CURRENT_FILE and not entry.startswith(".tmp-") and entry != current
+    )
+    for snapshot in snapshots[:-KEEP_SNAPSHOTS]:
+        shutil.rmtree(f"{folder}/{snapshot}", ignore_errors=True)
+
+
+def load_manifest(name):
+    snapshot = current_snapshot(name)
+    if snapshot is None or not os.path.exists(f"{snapshot}/manifest.json"):
+        return {}
+    with open(f"{snapshot}/manifest.json", encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,107 @@
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from langchain.schema import Document
+from utils.cache import DiskCache
+
+# WikipediaRetriever와 같은 기본값 (영문 위키피디아, 문서당 최대 4000자)
+API_URL = "https://en.wikipedia.org/w/api.php"
+PAGE_URL = "https://en.wikipedia.org/wiki/"
+DOC_CONTENT_CHARS_MAX = 4000
+FETCH_TIMEOUT = 10
+CACHE_PATH = "./.cache/wikipedia.sqlite"
+
+# 검색 결과와 "문서 -> 최신 revision" 정보는 짧게, revision별 본문은 바뀌지 않으므로 길게 보관
+SEARCH_TTL = 60 * 60 * 24
+REVISION_TTL = 60 * 60
+CONTENT_TTL = 60 * 60 * 24 * 30
+
+_session = requests.Session()
+_cache = None
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = DiskCache(CACHE_PATH, max_bytes=512 * 1024**2)
+    return _cache
+
+
+def call_api(params, api_url):
+    response = _session.get(
+        api_url,
+        params={"format": "json", "formatversion": 2, **params},
+        timeout=FETCH_TIMEOUT,
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def search_titles(term, top_k, api_url):
+    data = call_api({"action": "query", "list": "search", "srsearch": term, "srlimit": top_k}, api_url)
+    return [result["title"] for result in data["query"]["search"]]
+
+
+# 여러 문서의 최신 revision id를 한번의 요청으로 조회
+def latest_revisions(titles, api_url):
+    data = call_api({"action": "query", "prop": "revisions", "rvprop": "ids", "titles": "|".join(titles)}, api_url)
+    return {
+        page["title"]: page["revisions"][0]["revid"]
+        for page in data["query"]["pages"]
+        if page.get("revisions")
+    }
+
+
+def fetch_content(title, api_url):
+    data = call_api({"action": "query", "prop": "extracts", "explaintext": 1, "titles": title}, api_url)
+    pages = data["query"]["pages"]
+    return pages[0].get("extract", "") if pages else ""
+
+
+# WikipediaRetriever는 문서를 하나씩 순서대로 받아오므로, 검색한 문서들을 동시에 받아오고
+# (제목, revision) 단위로 디스크에 캐시해서 재시작 후나 다른 서버에서도 재사용
+# revision 정보가 만료되면 revision id만 다시 확인하고, 바뀐 문서의 본문만 새로 받아옴
+def search_wikipedia(term, top_k=5, api_url=API_URL):
+    cache = get_cache()
+    search_key = f"search:{api_url}:{top_k}:{' '.join(term.lower().split())}"
+    titles = cache.get(search_key)
+    if titles is None:
+        titles = search_titles(term, top_k, api_url)
+        cache.set(search_key, titles, ttl=SEARCH_TTL)
+    if not titles:
+        return []
+
+    revisions = {title: cache.get(f"revision:{api_url}:{title}") for title in titles}
+    expired = [title for title, revid in revisions.items() if revid is None]
+    if expired:
+        for title, revid in latest_revisions(expired, api_url).items():
+            revisions[title] = revid
+            cache.set(f"revision:{api_url}:{title}", revid, ttl=REVISION_TTL)
+
+    contents = {}
+    missing = []
+    for title in titles:
+        revid = revisions.get(title)
+        content = cache.get(f"content:{api_url}:{title}:{revid}") if revid else None
+        if content is None:
+            missing.append(title)
+        else:
+            contents[title] = content
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=len(missing)) as pool:
+            for title, content in zip(missing, pool.map(lambda title: fetch_content(title, api_url), missing)):
+                contents[title] = content
+                if revisions.get(title):
+                    cache.set(f"content:{api_url}:{title}:{revisions[title]}", content, ttl=CONTENT_TTL)
+
+    return [
+        Document(
+            page_content=contents[title][:DOC_CONTENT_CHARS_MAX],
+            metadata={
+                "title": title,
+                "source": PAGE_URL + title.replace(" ", "_"),
+            },
+        )
+        for title in titles
+        if contents.get(title)
+    ]